@@ -0,0 +1,94 @@
+"""
+Micro-batcher for agent invocations.
+
+Single /chat requests each pay the full LLM round-trip on their own; when
+several arrive within a few milliseconds they can share one batched call via
+`agent.abatch`, which amortizes the per-request overhead on the backend.
+Requests enqueue (payload, config, Future) items; a background loop drains
+the queue, waits a tiny window for company, dispatches one batch, and
+resolves each Future with its slice of the result. A lone request falls
+through to a plain `ainvoke`, so latency for quiet traffic is unchanged.
+"""
+import asyncio
+from typing import Any, Dict, Optional
+
+from Agent.llm import agent
+
+# Cap on requests fused into one backend call; past this the KV/bandwidth
+# win flattens while the slowest member delays the whole batch.
+MAX_BATCH = 8
+# How long the first arrival waits for companions. A few ms is invisible
+# next to LLM latency but long enough to catch a concurrent burst.
+BATCH_WINDOW = 0.005  # seconds
+
+_QUEUE: "asyncio.Queue[tuple]" = asyncio.Queue()
+_LOOP_TASK: Optional[asyncio.Task] = None
+
+
+def _ensure_loop() -> None:
+    """Start (or restart) the drain task on the current event loop."""
+    global _LOOP_TASK
+    if _LOOP_TASK is None or _LOOP_TASK.done():
+        _LOOP_TASK = asyncio.create_task(batch_loop())
+
+
+async def submit(payload: Dict[str, Any], config: Dict[str, Any]) -> Any:
+    """
+    Queue one agent invocation and await its result.
+
+    Equivalent to `await agent.ainvoke(payload, config=config)` but eligible
+    for fusion with other requests in flight at the same moment.
+    """
+    fut = asyncio.get_running_loop().create_future()
+    await _QUEUE.put((payload, config, fut))
+    _ensure_loop()
+    return await fut
+
+
+async def batch_loop() -> None:
+    """Drain the queue forever, dispatching micro-batches as they form."""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await _QUEUE.get()]
+        deadline = loop.time() + BATCH_WINDOW
+        while len(batch) < MAX_BATCH:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(_QUEUE.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        await _dispatch(batch)
+
+
+async def _dispatch(batch: list) -> None:
+    """Run one batch and fulfil each member's Future."""
+    if len(batch) == 1:
+        payload, config, fut = batch[0]
+        try:
+            result = await agent.ainvoke(payload, config=config)
+        except Exception as e:
+            if not fut.done():
+                fut.set_exception(e)
+            return
+        if not fut.done():
+            fut.set_result(result)
+        return
+
+    payloads = [item[0] for item in batch]
+    configs = [item[1] for item in batch]
+    try:
+        results = await agent.abatch(payloads, config=configs, return_exceptions=True)
+    except Exception as e:
+        for _, _, fut in batch:
+            if not fut.done():
+                fut.set_exception(e)
+        return
+    for (_, _, fut), result in zip(batch, results):
+        if fut.done():
+            continue
+        if isinstance(result, Exception):
+            fut.set_exception(result)
+        else:
+            fut.set_result(result)
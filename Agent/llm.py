@@ -1,4 +1,4 @@
-import asyncio, os, sys
+import asyncio, collections, os, sys
 from dotenv import load_dotenv
 from langchain_groq import ChatGroq
 from langgraph.checkpoint.memory import InMemorySaver
@@ -31,7 +31,12 @@ class ToolEventCollector(BaseCallbackHandler):
     Collects tool events into a JSON-serializable structure.
     """
     def __init__(self, parse_input=True, parse_output=True):
-        self.events = []  # [{name, input, output}]
+        # Bounded so a long-lived collector (e.g. the module-level CLI one)
+        # cannot grow without limit; old events fall off the front. Appends
+        # stay O(1) and web handlers only ever read the newest entries.
+        self.events = collections.deque(
+            maxlen=int(os.getenv("COLLECTOR_MAX", "4096"))
+        )  # [{name, input, output}]
         self.parse_input = parse_input
         self.parse_output = parse_output
 
@@ -1,68 +1,175 @@
-import asyncio, sys, os
-from playwright.async_api import async_playwright, Page, Browser, TimeoutError as PlaywrightTimeoutError  # type: ignore
+import asyncio, sys, os, time
+from collections import OrderedDict
+from playwright.async_api import async_playwright, Page, Browser, BrowserContext, TimeoutError as PlaywrightTimeoutError  # type: ignore
 from typing import Dict, Any, Optional, Tuple, List, Literal, Union
 import re
 from datetime import datetime
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from urllib.parse import urlparse
 from uuid import uuid4
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from Utils.session_manager import create_session, close_session, get_session
-from Utils.schemas import FlightSearchInput, GetFlightURLsInput, SelectCurrencyInput, CloseSessionInput
+from Utils.session_manager import create_session, close_session, get_session, save_session_state, session_exists
+from pydantic import TypeAdapter
+from Utils.schemas import FlightSearchInput, GetFlightURLsInput, SelectCurrencyInput
 from Utils.logger import setup_logger
 
+# TypeAdapters reuse a cached core schema, which is markedly cheaper than
+# model __init__ when the agent calls the same tool in a tight loop.
+_SEARCH_ADAPTER = TypeAdapter(FlightSearchInput)
+_GFU_ADAPTER = TypeAdapter(GetFlightURLsInput)
+_CURRENCY_ADAPTER = TypeAdapter(SelectCurrencyInput)
+
 logger = setup_logger(name="search_flights", log_level="INFO")
+
+# Precompiled patterns for the parsing hot paths; compiling per call would hit
+# re's bounded pattern cache on every flight row.
+_HR_RE = re.compile(r'(\d+)\s*hr')
+_MIN_RE = re.compile(r'(\d+)\s*min')
+_INT_RE = re.compile(r"\d+")
+_AIRLINE_SPLIT_RE = re.compile(r' and |, ')
+# All top-level fields of a flight aria-label combined into one alternation so
+# the text is scanned once; each finditer hit is dispatched on its named group.
+# The leaves/arrives terminators are lookaheads so a following "Total duration"
+# segment is not consumed and can still match on the same pass.
+_FLIGHT_RE = re.compile(
+    r"From (?P<price>\d+)"
+    r"|(?P<stops>Nonstop|\d+ stops?|1 stop) flight with (?P<airlines>[\w\s,&]+?)\."
+    r"|Leaves\s+(?P<dep_airport>.*?)\s+at\s+(?P<dep_time>[\d:]{1,2}:\d{2}\s*[AP]M)\s+on\s+(?P<dep_date>.+?)\s+and arrives at\s+(?P<arr_airport>.*?)\s+at\s+(?P<arr_time>[\d:]{1,2}:\d{2}\s*[AP]M)\s+on\s+(?P<arr_date>.+?)(?:\.|(?= Total duration| Layover)|$)"
+    r"|Total duration\s+(?P<duration>[\d\s+hr\s+\d\s+min]+)\."
+)
+_LAYOVER_RE = re.compile(r"Layover \((\d+) of \d+\) is a ([\d\s+hrmin]+)(\s+overnight)? layover at (.*?)(?:\.|$)")
+# Provider labels on booking cards; compiled once instead of per card, with
+# re.ASCII since the literal anchors are plain latin text.
+_BOOK_WITH_RE = re.compile(r"Book\s+with\s+(.+)", re.ASCII)
+_CALL_TO_BOOK_RE = re.compile(r"Call\s+(.+)\s+to\s+book", re.ASCII)
+# Google renders prices/times with narrow and regular no-break spaces; one
+# translate pass normalizes both, instead of a str.replace scan per character.
+_NBSP_TABLE = str.maketrans({"\u202F": " ", "\u00A0": " "})
+
+# Static selectors reused across calls; hoisted so hot loops neither rebuild
+# the strings nor re-parse them per iteration.
+_ORIGIN_INPUT_SEL = "input[aria-label^='Where from?']"
+_DEST_INPUT_SEL = "input[aria-label^='Where to?']"
+_FLIGHT_CARD_SEL = "li.pIav2d"
+_BOOKING_CARD_SEL = "div.gN1nAc"
+_CTN_BUTTON_SEL = "button:has-text('Continue'), button:has-text('Go to site'), button:has-text('Book')"
+
 # --- Helper Functions ---
 async def wait_for_element_to_appear(
-    page: Page, selector: str, timeout_ms: int = 10000, check_interval_ms: int = 500
-) -> bool:
+    page: Page, selector: str, timeout_ms: int = 10000) -> bool:
     """
     Waits for a specific element to appear on the page within a timeout period.
 
+    Uses Playwright's event-driven waiter, which returns as soon as the element
+    becomes visible instead of polling on a fixed interval.
+
     Args:
         page (Page): The Playwright page instance or locator.
         selector (str): CSS selector of the target element.
         timeout_ms (int, optional): Maximum wait time in milliseconds. Defaults to 10000.
-        check_interval_ms (int, optional): Interval between checks in milliseconds. Defaults to 500.
 
     Returns:
         bool: True if the element appears before timeout, False otherwise.
     """
-    max_checks = timeout_ms // check_interval_ms
-    
-    for attempt in range(max_checks):
-        if await page.locator(selector).count() > 0:
-            if await page.locator(selector).first.is_visible():
-                return True
-        await asyncio.sleep(check_interval_ms / 1000)
-    return False
-        
+    try:
+        await page.locator(selector).first.wait_for(state="visible", timeout=timeout_ms)
+        return True
+    except PlaywrightTimeoutError:
+        return False
+
+
+# Numba is optional: when available, duration parsing drops to a compiled
+# byte scan, which pays off when parsing large batches of flight results.
+try:
+    from numba import njit  # type: ignore
+except ImportError:
+    njit = None
+
+if njit is not None:
+    @njit(cache=True)
+    def _scan_duration(data: bytes) -> int:
+        """Walk the bytes of '18 hr 5 min', committing digits on 'h'/'m'."""
+        hours = 0
+        minutes = 0
+        num = 0
+        has_num = False
+        for i in range(len(data)):
+            c = data[i]
+            if 48 <= c <= 57:  # '0'..'9'
+                num = num * 10 + (c - 48)
+                has_num = True
+            elif c == 104 and has_num:  # 'h' commits hours
+                hours = num
+                num = 0
+                has_num = False
+            elif c == 109 and has_num:  # 'm' commits minutes
+                minutes = num
+                num = 0
+                has_num = False
+        return hours * 60 + minutes
+
+    _scan_duration(b"1 hr 1 min")  # warm the JIT outside the hot path
+
 
 def convert_duration_to_minutes(duration_str: str) -> int:
     """
     Converts a flight duration string (e.g., '18 hr 5 min') to total minutes.
     """
+    if njit is not None:
+        return int(_scan_duration(duration_str.encode()))
+
     hours = 0
     minutes = 0
 
     # Match hours (e.g., "18 hr" or "1 hr")
-    hour_match = re.search(r'(\d+)\s*hr', duration_str)
+    hour_match = _HR_RE.search(duration_str)
     if hour_match:
         hours = int(hour_match.group(1))
 
     # Match minutes (e.g., "5 min" or "55 min")
-    min_match = re.search(r'(\d+)\s*min', duration_str)
+    min_match = _MIN_RE.search(duration_str)
     if min_match:
         minutes = int(min_match.group(1))
-    
+
     total_minutes = (hours * 60) + minutes
     return total_minutes
 
 
+# Shape pretests for parse_dates: each input is classified by a cheap regex so
+# exactly one strptime runs, instead of raising/catching ValueError per format.
+# Month words of 4+ letters dispatch to %B, 3-letter abbreviations to %b.
+_DATE_PATTERNS = [
+    (re.compile(r"^\d{4}-\d{1,2}-\d{1,2}$"), "%Y-%m-%d", False),
+    (re.compile(r"^\d{1,2}/\d{1,2}/\d{4}$"), "%d/%m/%Y", False),
+    (re.compile(r"^[A-Za-z]{4,} \d{1,2}, \d{4}$"), "%B %d, %Y", False),
+    (re.compile(r"^\d{1,2} [A-Za-z]{4,} \d{4}$"), "%d %B %Y", False),
+    (re.compile(r"^\d{1,2} [A-Za-z]{3} \d{4}$"), "%d %b %Y", False),
+    (re.compile(r"^[A-Za-z]{3} \d{1,2}, \d{4}$"), "%b %d, %Y", False),
+    (re.compile(r"^[A-Za-z]{4,} \d{1,2}$"), "%B %d", True),
+    (re.compile(r"^[A-Za-z]{3} \d{1,2}$"), "%b %d", True),
+    (re.compile(r"^\d{1,2} [A-Za-z]{4,}$"), "%d %B", True),
+    (re.compile(r"^\d{1,2} [A-Za-z]{3}$"), "%d %b", True),
+    (re.compile(r"^\d{1,2}-\d{1,2}$"), "%m-%d", True),
+    (re.compile(r"^\d{1,2}/\d{1,2}$"), "%d/%m", True),
+]
+
+@lru_cache(maxsize=256)
+def _parse_dates_cached(base: str, year: int) -> datetime:
+    """Dispatch a normalized date string to exactly one strptime call."""
+    for shape, fmt, need_year in _DATE_PATTERNS:
+        if shape.match(base):
+            probe = f"{base} {year}" if need_year else base
+            return datetime.strptime(probe, fmt + (" %Y" if need_year else ""))
+    raise ValueError(f"Date format not recognized: '{base}'")
+
+
 def parse_dates(input_dates: str, default_year: int = None):
     """
     Accepts date input in various string formats and converts it to a datetime object.
     If no year is specified, it uses the current year or the given default_year.
-    
+
     Examples of supported formats:
     - "2025-07-13"
     - "13/07/2025"
@@ -77,29 +184,7 @@ def parse_dates(input_dates: str, default_year: int = None):
         raise ValueError("Date input cannot be None. Please provide a valid date string.")
     base = input_dates.strip()
     year = default_year or datetime.now().year
-        
-    candidate_format = [
-        ("%Y-%m-%d", False),
-        ("%d/%m/%Y", False),
-        ("%B %d, %Y", False),
-        ("%d %B %Y", False),
-        ("%d %b %Y", False),
-        ("%b %d, %Y", False),
-        ("%B %d", True),
-        ("%d %B", True),
-        ("%d %b", True),
-        ("%m-%d", True),
-        ("%d/%m", True),
-    ]
-
-    for fmt, need_year in candidate_format:
-        try:
-            probe = f"{base} {year}" if need_year else base
-            return datetime.strptime(probe, fmt + (" %Y" if need_year else ""))
-        except ValueError:
-            continue
-
-    raise ValueError(f"Date format not recognized: '{input_dates}'")
+    return _parse_dates_cached(base, year)
 
 
 # --- Interaction Functions ---
@@ -110,10 +195,10 @@ async def get_currency(page: Page) -> Optional[str]:
     try:
         await wait_for_element_to_appear(page, "span.VfPpkd-vQzf8d", timeout_ms=10000)
         currency = await page.locator("span.twocKe").nth(2).inner_text()
-        logger.info(f"Currency detected : {currency}.")
+        logger.info("Currency detected : %s.", currency)
         return currency
     except Exception as e:
-        logger.warning(f"Warning: Could not find price element on page: {e}")
+        logger.warning("Warning: Could not find price element on page: %s", e)
         return None
     
 
@@ -124,17 +209,16 @@ async def select_flight_class(page: Page, flight_class: str = "Economy"):
         flight_class (str): Class of flight to select ("Economy", "Premium economy", "Business", "First").
     """
     try:
-        # Click the dropdown trigger for flight class
-        await wait_for_element_to_appear(page, "div.VfPpkd-aPP78e", timeout_ms=10000)
-        await page.locator("div.VfPpkd-aPP78e").nth(1).click()
+        # Click the dropdown trigger for flight class; the click auto-waits
+        # for visibility with the same budget the explicit wait used to have.
+        await page.locator("div.VfPpkd-aPP78e").nth(1).click(timeout=10000)
 
-        # Wait for the options to appear and select the desired flight class
-        await wait_for_element_to_appear(page, "li[role='option']", timeout_ms=5000)
-        await page.locator(f"li[role='option']:has-text('{flight_class}')").first.click()
+        # Select the desired flight class once its option renders
+        await page.locator(f"li[role='option']:has-text('{flight_class}')").first.click(timeout=5000)
         
-        logger.info(f"Flight class {flight_class} selected successfully.")
+        logger.info("Flight class %s selected successfully.", flight_class)
     except Exception as e:
-        logger.exception(f"Error selecting flight class: {e}")
+        logger.exception("Error selecting flight class: %s", e)
         # raise
 
 
@@ -145,22 +229,19 @@ async def fill_origin(page: Page, origin: str):
         origin (str): The origin to fill in the input field.
     """
     try:
-        origin_input_selector = "input[aria-label^='Where from?']" 
-        await wait_for_element_to_appear(page, origin_input_selector, timeout_ms=10000)
-        
-        origin_input_locator = page.locator(origin_input_selector)
-        await origin_input_locator.fill(origin)
+        origin_input_locator = page.locator(_ORIGIN_INPUT_SEL)
+        await origin_input_locator.fill(origin, timeout=10000)
         
         # Wait for the suggestion to appear and click it.
         origin_selector = f"//li[@role='option'][contains(., '{origin}')]"
         if await wait_for_element_to_appear(page, origin_selector, timeout_ms=5000):
             origin_option = page.locator(origin_selector) 
             await origin_option.first.click()
-            logger.info(f"Origin {origin} filled successfully.")
+            logger.info("Origin %s filled successfully.", origin)
         else:
             raise ValueError(f"{origin} is not exist")
     except Exception as e:
-        logger.exception(f"Error filling origin: {e}")
+        logger.exception("Error filling origin: %s", e)
         # raise
 
 
@@ -171,22 +252,19 @@ async def fill_destination(page: Page, destination: str):
         destination (str): The destination to fill in the input field.
     """
     try:
-        destination_input_selector = "input[aria-label^='Where to?']"
-        await wait_for_element_to_appear(page, destination_input_selector, timeout_ms=15000)
-        
-        destination_input_locator = page.locator(destination_input_selector)
-        await destination_input_locator.fill(destination)
+        destination_input_locator = page.locator(_DEST_INPUT_SEL)
+        await destination_input_locator.fill(destination, timeout=15000)
 
         # Wait for the suggestion to appear and click it.
         destination_selector = f"//li[@role='option'][contains(., '{destination}')]"
         if await wait_for_element_to_appear(page, destination_selector, timeout_ms=5000):
             destination_option = page.locator(destination_selector)
             await destination_option.first.click()
-            logger.info(f"Destination {destination} filled successfully.")
+            logger.info("Destination %s filled successfully.", destination)
         else:
             raise ValueError(f"{destination} is not exist")
     except Exception as e:
-        logger.exception(f"Error filling destination: {e}")
+        logger.exception("Error filling destination: %s", e)
         # raise
 
 
@@ -202,30 +280,30 @@ async def set_dates(page: Page, departure_date: str):
     try:
         departure_selector = "input[aria-label='Departure']"
         if await wait_for_element_to_appear(page, departure_selector):
-            departure_input = page.locator(departure_selector).nth(0)
-            if await departure_input.is_visible() and await departure_input.is_enabled():
+            departure_locator = page.locator(departure_selector)
+            departure_input = departure_locator.nth(0)
+            try:
+                await departure_input.click(force=True, timeout=5000)
+            except Exception:
+                # Fall back to a DOM-level click when the normal click is intercepted
                 element_handle = await departure_input.element_handle()
                 if element_handle:
                     await element_handle.evaluate("element => element.click()")
                 else:
-                    logger.warning("Date can not be set")
+                    logger.warning("🚨 Date can not be set")
                     return
 
-            else:
-                logger.warning("🚨 Date can not be set")
-                return
-            
-            await wait_for_element_to_appear(page, "div.WhDFk Io4vne") # wait for calendar to visible clearly
+            await wait_for_element_to_appear(page, "div.WhDFk.Io4vne") # wait for calendar to visible clearly
 
-            await page.locator(departure_selector).nth(1).fill(departure_date)
-            await page.keyboard.press("Enter")
-            await page.keyboard.press("Enter")
-            logger.info(f"The date has been set successfully to {departure_date}.")
+            await departure_locator.nth(1).fill(departure_date)
+            # One batched call for both Enters (confirm the date, close the picker)
+            await page.keyboard.type("\n\n")
+            logger.info("The date has been set successfully to %s.", departure_date)
 
         else:
             logger.warning("Date can not be set")
     except Exception as e:
-        logger.exception(f"Error setting departure or return date: {e}")
+        logger.exception("Error setting departure or return date: %s", e)
         # raise
 
 
@@ -251,26 +329,32 @@ async def set_number_of_passengers(
         "infant on lap": infants_on_lap
     }
     try:
-        passenger_selector = "div.VfPpkd-RLmnJb"
-        await wait_for_element_to_appear(page, passenger_selector, timeout_ms=10000)
-        await page.get_by_role("button", name="1 passenger").click()
+        await page.get_by_role("button", name="1 passenger").click(timeout=10000)
         for passenger_type, count in passengers.items():
             if count > 0:
-                current_count = 1 if passenger_type == "adult" else 0
-
-                while current_count < count:
-                    add_button_selector = f"button[aria-label='Add {passenger_type}']"
-                    await page.locator(add_button_selector).click()
-                    current_count += 1
+                baseline = 1 if passenger_type == "adult" else 0
+                clicks_needed = count - baseline
+                if clicks_needed <= 0:
+                    continue
+                # Dispatch all clicks for this passenger type inside the browser:
+                # one evaluate round-trip instead of one per click.
+                await page.locator(f"button[aria-label='Add {passenger_type}']").evaluate(
+                    "(btn, n) => { for (let i = 0; i < n; i++) btn.click(); }",
+                    clicks_needed,
+                )
         
         await page.get_by_role("button", name="Done").click() # close the passenger menu
         logger.info("Number of passengers set successfully. ")
     except Exception as e:
-        logger.exception(f"Error setting number of passengers: {e}")
+        logger.exception("Error setting number of passengers: %s", e)
         # raise
     
 
-async def get_flights(page: Page, flight_class: str = "Economy", limiter: int = 10) -> Tuple[Dict[str, Any], str, Optional[str]]:
+# Default cap on flight cards read from a results page; shared with the
+# currency-change re-read so both paths collect the same number of rows.
+_DEFAULT_LIMITER = 10
+
+async def get_flights(page: Page, flight_class: str = "Economy", limiter: int = _DEFAULT_LIMITER) -> Tuple[Dict[str, Any], str, Optional[str]]:
     """ Retrieves flight results from the page.
     Args:
         page (Page): The Playwright page instance.
@@ -279,8 +363,6 @@ async def get_flights(page: Page, flight_class: str = "Economy", limiter: int =
     Returns:
         Tuple[Dict[str, Any], str, str]: A tuple containing flight results, flight class and currency.
     """
-    global  global_limiter
-    global_limiter = limiter
     flight_results = {}
 
     try:
@@ -289,41 +371,129 @@ async def get_flights(page: Page, flight_class: str = "Economy", limiter: int =
 
         # Click the search button to initiate the flight search
         search_results_selector = "button[aria-label='Search']"
+        search_button = page.locator(search_results_selector)
         await wait_for_element_to_appear(page, search_results_selector, timeout_ms=15000)
-        if not await page.locator(search_results_selector).is_visible():
+        if not await search_button.is_visible():
             logger.warning("No available flight for this search parameter")
-            return flight_results, flight_class
-        await page.locator(search_results_selector).click()
-        await page.wait_for_timeout(5000)  # Wait for the search results to load
+            return flight_results, flight_class, currency
+        await search_button.click()
+        # Wait for either the results list or the no-results alert instead of a blind sleep
+        await wait_for_element_to_appear(
+            page, "li.pIav2d, div[role='alert']:has-text('No results returned.')", timeout_ms=15000
+        )
 
         # Handle searching progress if there are no result
         flight_class_used = flight_class
         if await page.locator("div[role='alert']:has-text('No results returned.')").is_visible():
-            logger.warning(f"There are no flights for this class. Changing flight class to Economy...")
+            logger.warning("There are no flights for this class. Changing flight class to Economy...")
             await select_flight_class(page, flight_class="Economy")
-            await page.wait_for_load_state("networkidle", timeout=30000)
+            # Wait for the thing we actually need — result cards — instead of
+            # networkidle, which Google's analytics beacons keep from firing.
+            # Economy can come up empty too; fall through to the card read,
+            # which then returns no flights instead of raising.
+            try:
+                await page.locator(_FLIGHT_CARD_SEL).first.wait_for(timeout=15000)
+            except PlaywrightTimeoutError:
+                logger.warning("No flights for Economy either.")
             flight_class_used = "Economy"
 
-        # Wait for the flight results to appear
-        top_flights_locator = await page.locator("li.pIav2d").all()
-        
+        # Read every card's aria-label in one browser round-trip instead of one per card
+        travel_details = await page.eval_on_selector_all(
+            "li.pIav2d",
+            "els => els.map(e => e.querySelector('div.JMc5Xc')?.getAttribute('aria-label'))",
+        )
+
         seen_details = set()
-        for i, flight in enumerate(top_flights_locator):
-            travel_detail = await flight.locator("div.JMc5Xc").first.get_attribute("aria-label")
-            if travel_detail not in seen_details:
+        for i, travel_detail in enumerate(travel_details[:limiter]):
+            if travel_detail and travel_detail not in seen_details:
                 flight_results[f"Flight {i+1}"] = travel_detail
                 seen_details.add(travel_detail)
-            if i+1 >= limiter:
-                break
-            
-        logger.info(f"Found {len(flight_results)} flights.") if len(flight_results) > 0 else logger.error("No departing flight found")
+
+        logger.info("Found %d flights.", len(flight_results)) if len(flight_results) > 0 else logger.error("No departing flight found")
         return (flight_results, flight_class_used, currency)
     except Exception as e:
-        logger.error(f"Error retrieving departing flight: {e}")
+        logger.error("Error retrieving departing flight: %s", e)
         raise
     
         
 # --- Parsing Functions ---
+@lru_cache(maxsize=2048)
+def _parse_single(text: str, currency: Optional[str] = None) -> Dict[str, Any]:
+    """ Parses one flight aria-label into a structured dict in a single regex pass.
+
+    Memoized by (text, currency): the same flight reappearing across repeat
+    searches skips all regex work. Callers must copy the returned dict before
+    mutating it.
+
+    Args:
+        text (str): The flight detail text with non-breaking spaces normalized.
+        currency (Optional[str]): The currency symbol used in the prices (optional).
+    Returns:
+        Dict[str, Any]: Structured flight details; unmatched fields stay None.
+    """
+    result = {
+        "stops": None,
+        "airlines": None,
+        "departure_airport": None,
+        "departure_time": None,
+        "departure_date": None,
+        "arrival_airport": None,
+        "arrival_time": None,
+        "arrival_date": None,
+        "flight_duration": None,
+    }
+
+    for m in _FLIGHT_RE.finditer(text):
+        if m.group("price") is not None:
+            prefix = f"{currency} " if currency else ""
+            result["price"] = f"{prefix}{int(m.group('price')):,}"
+        elif m.group("stops") is not None:
+            stops_str = m.group("stops")
+            if stops_str == "Nonstop":
+                result["stops"] = 0
+            elif stops_str == "1 stop":
+                result["stops"] = 1
+            else:
+                result["stops"] = int(_INT_RE.search(stops_str).group())
+            result["airlines"] = [a.strip() for a in _AIRLINE_SPLIT_RE.split(m.group("airlines"))]
+        elif m.group("dep_airport") is not None:
+            result["departure_airport"] = m.group("dep_airport")
+            result["departure_time"] = m.group("dep_time")
+            result["departure_date"] = m.group("dep_date")
+            result["arrival_airport"] = m.group("arr_airport")
+            result["arrival_time"] = m.group("arr_time")
+            result["arrival_date"] = m.group("arr_date")
+        elif m.group("duration") is not None:
+            result["flight_duration"] = m.group("duration")
+
+    layovers = [
+        {
+            'layover_number': int(lay.group(1)),
+            'layover_duration': lay.group(2),
+            'overnight': bool(lay.group(3)),
+            'layover_airport': lay.group(4)
+        }
+        for lay in _LAYOVER_RE.finditer(text)
+    ]
+    result['layovers'] = layovers if layovers else None
+    return result
+
+
+# Fields that must be non-None for a parsed flight to count as valid. "price"
+# is only keyed when matched (and never None then), so it needs no entry here;
+# layovers/airlines/flight_duration are legitimately absent on some cards.
+_MANDATORY_FIELDS = (
+    "stops",
+    "departure_airport",
+    "departure_time",
+    "departure_date",
+    "arrival_airport",
+    "arrival_time",
+    "arrival_date",
+)
+_INVALID_FLIGHT = {"Error": "Flight details are not valid: mandatory field is None."}
+
+
 def parse_flight_results(flight_results: Dict[str, Any], currency: Optional[str] = None) -> Dict[str, Any]:
     """ Parses flight results into a more structured format.
     Args:
@@ -339,114 +509,95 @@ def parse_flight_results(flight_results: Dict[str, Any], currency: Optional[str]
     
     for flight, details in flight_results.items():
         try:
-            text = details.replace('\u202f', ' ')
-            result = {}
-
-            # price extraction
-            price_m = re.search(r"From (\d+)", text)
-            if price_m:
-                prefix = f"{currency} " if currency else ""
-                price = f"{prefix}{int(price_m.group(1)):,}"
-                result["price"] = price
-
-            # number of stops extraction and airline extraction
-            stops = None
-            airlines = None
-            stops_m = re.search(r"(Nonstop|\d+ stops?|1 stop) flight with ([\w\s,&]+?)\.", text)
-            if stops_m:
-                stops_str = stops_m.group(1)
-                if stops_str == "Nonstop":
-                    stops = 0
-                elif stops_str == "1 stop":
-                    stops = 1
-                else:
-                    stops = int(re.search(r"\d+", stops_str).group())
-                airlines = [a.strip() for a in re.split(r' and |, ', stops_m.group(2))]
-            result["stops"] = stops
-            result["airlines"] = airlines
-
-            # departure and arrival details extraction
-            m = re.search(
-                r"Leaves\s+(.*?)\s+at\s+([\d:]{1,2}:\d{2}\s*[AP]M)\s+on\s+(.+?)\s+and arrives at\s+(.*?)\s+at\s+([\d:]{1,2}:\d{2}\s*[AP]M)\s+on\s+(.+?)(?:\.| Total duration| Layover|$)",
-                text.replace('\u202f', ' ')
-            )
-            if m:
-                result['departure_airport'] = m.group(1)
-                result['departure_time'] = m.group(2)
-                result['departure_date'] = m.group(3)
-                result['arrival_airport'] = m.group(4)
-                result['arrival_time'] = m.group(5)
-                result['arrival_date'] = m.group(6)
-            else:
-                result['departure_airport'] = result['departure_time'] = result['departure_date'] = None
-                result['arrival_airport'] = result['arrival_time'] = result['arrival_date'] = None
-            
-            # total duration extraction
-            duration_m = re.search(r"Total duration\s+([\d\s+hr\s+\d\s+min]+)\.", text)
-            result['flight_duration'] = duration_m.group(1) if duration_m else None
-
-            # layover extraction
-            layover_pattern = re.compile(r"Layover \((\d+) of \d+\) is a ([\d\s+hrmin]+)(\s+overnight)? layover at (.*?)(?:\.|$)")
-            layovers = []
-            for lay in layover_pattern.finditer(text):
-                layovers.append({
-                    'layover_number': int(lay.group(1)),
-                    'layover_duration': lay.group(2),
-                    'overnight': bool(lay.group(3)),
-                    'layover_airport': lay.group(4)
-                })
-            result['layovers'] = layovers if layovers else None
+            text = details.translate(_NBSP_TABLE)
+            # Copy so callers can mutate their result without corrupting the cache.
+            result = dict(_parse_single(text, currency))
             parsed_results[flight] = result
 
-            keys_allowed_to_be_none = ['layovers', 'airlines', 'flight_duration']
-            if any(
-                result.get(key) is None 
-                for key in result.keys() 
-                if key not in keys_allowed_to_be_none
-            ):
-                parsed_results[flight] = {"Error": "Flight details are not valid: mandatory field is None."}
+            for key in _MANDATORY_FIELDS:
+                if result[key] is None:
+                    parsed_results[flight] = _INVALID_FLIGHT
+                    break
 
         except Exception as e:
-            logger.error(f"Error parsing flight {flight}: {e}")
+            logger.error("Error parsing flight %s: %s", flight, e)
             # raise
 
     return parsed_results
 
 # --- URL Extraction Functions ---
-async def extract_logo_url(root) -> str:
-    """Extract booking agent logo URL from style attribute."""
-    logo_locator = root.locator("div[class='MnHIn P2UJoe']").first
-    style_attr = await logo_locator.get_attribute("style") or ""
-    match = re.findall(r"url\((.*?)\)", style_attr)
-    return match[0] if match else ""
-
-async def extract_price(root) -> str:
-    """Extract booking price, replacing non-breaking spaces."""
-    price_locator = root.locator("div.ScwYP")
-    if await wait_for_element_to_appear(root, "div.ScwYP"):
-        price = await price_locator.inner_text()
-        return price.replace("\u00A0", " ")
-    return "Visit site for price"
-
-async def extract_booking_name(root, xpath: str, pattern: str) -> str:
-    """Extract booking agent/provider name using an XPath and regex pattern."""
-    name_locator = root.locator(xpath)
-    booking_name = await name_locator.inner_text()
-    match = re.findall(pattern, booking_name)
-    return match[0].strip() if match else None
+async def prefetch_booking_cards(page: Page) -> List[Dict[str, str]]:
+    """
+    Bulk-read the static fields of every visible booking card in one evaluate.
+
+    Logo URL, price, provider label, and call number never change after the
+    cards render, so reading them per card (3+ round-trips each) only added
+    protocol latency. The click loop handles just the dynamic popup URLs.
+    """
+    return await page.eval_on_selector_all(
+        "div.gN1nAc",
+        """els => els.map(card => ({
+            logo: ((card.querySelector("div[class='MnHIn P2UJoe']")?.getAttribute('style') || '')
+                .match(/url\\((.*?)\\)/) || [])[1] || '',
+            price: card.querySelector('div.ScwYP')?.innerText || '',
+            name: card.querySelector('div.ogfYpf.AdWm1c')?.innerText || '',
+            call: card.querySelector('div.bcmwcd')?.innerText || '',
+        }))""",
+    )
 
 flight_url_logger = setup_logger(name="get_flight_urls", log_level="INFO")
+
+def _is_external_booking_url(url: str) -> bool:
+    """True once a popup has left Google and landed on a provider domain."""
+    netloc = urlparse(url).netloc
+    return bool(netloc) and not netloc.endswith("google.com")
+
+async def _resolve_popup_url(new_page, booking_option: Dict[str, str], popup_wait_ms: int, sem: asyncio.Semaphore) -> None:
+    """
+    Wait for a provider popup to settle, record its URL, and close it.
+
+    Runs as a background task so the main loop can keep clicking the next
+    booking card while earlier popups are still loading. Providers that
+    redirect synchronously are captured immediately; the rest wait until the
+    tab goes network-quiet instead of a fixed delay.
+    """
+    async with sem:
+        try:
+            if not _is_external_booking_url(new_page.url):
+                try:
+                    await new_page.wait_for_load_state("domcontentloaded", timeout=popup_wait_ms)
+                    # Redirect chains settle fast once the DOM is up, so the
+                    # idle wait is capped well below the full popup budget.
+                    await new_page.wait_for_load_state("networkidle", timeout=min(1500, popup_wait_ms))
+                except PlaywrightTimeoutError:
+                    pass
+            booking_option["booking_url"] = new_page.url
+            flight_url_logger.info("Booking URL extracted successfully")
+        except Exception as e:
+            flight_url_logger.warning("Could not resolve popup URL: %s", e)
+        finally:
+            try:
+                await new_page.close()
+            except Exception:
+                pass
+
 async def get_flight_urls(
-    page: Page, 
-    flight_results: Dict[str, Any], 
-    flight_no: Union[int,str] = 1,
+    context: BrowserContext,
+    flight_results: Dict[str, Any],
+    flight_no: int = 1,
     popup_wait_ms: int = 3000, #wait time after popup appears (ms)
-    max_providers: Optional[int] = 5
+    max_providers: Optional[int] = 5,
+    main_page: Optional[Page] = None,
 ) -> List[Dict[str, str]]:
     """
     Collect all booking (merchant) URLs for one selected flight on Google Flights.
+
+    Takes the session's BrowserContext (provider popups are sibling tabs and
+    must be awaited on the context, not a single page); `main_page` is the
+    results page holding the flight cards, defaulting to the context's first.
     """
     booking_options = []
+    page = main_page if main_page is not None else context.pages[0]
 
     # Get selected flight detail
     detail = flight_results.get(f"Flight {flight_no}")
@@ -478,76 +629,88 @@ async def get_flight_urls(
             flight_url_logger.info("Page reloaded due to error.")
 
         # Case 3: Booking options available
-        await wait_for_element_to_appear(page, "div.gN1nAc")
-        booking_cards = page.locator("div.gN1nAc")
-        total_cards = await booking_cards.count()
-
-        for idx in range(total_cards):
-            if max_providers is not None and idx >= max_providers:
+        await wait_for_element_to_appear(page, _BOOKING_CARD_SEL)
+        booking_cards = page.locator(_BOOKING_CARD_SEL)
+        prefetched = await prefetch_booking_cards(page)
+        total_cards = len(prefetched)
+
+        # Popup URL resolution happens in background tasks so the network waits
+        # of independent providers overlap instead of serializing.
+        popup_sem = asyncio.Semaphore(3)
+        popup_tasks: List[asyncio.Task] = []
+
+        # Scan up to twice the requested provider count: a card that errors is
+        # skipped instead of aborting the batch, and the spare candidates keep
+        # the batch full when one provider misbehaves.
+        max_scan = total_cards if max_providers is None else min(total_cards, max_providers * 2)
+
+        for idx in range(max_scan):
+            if max_providers is not None and len(booking_options) >= max_providers:
                 break
 
-            book = booking_cards.nth(idx)
-
-            # Try continue/go to site/book buttons
-            ctn_selector = "button:has-text('Continue'), button:has-text('Go to site'), button:has-text('Book')" 
-            has_ctn = await wait_for_element_to_appear(book, ctn_selector)
-
-            booking_option = {}
-
-            if has_ctn:
-                booking_option["logo_url"] = await extract_logo_url(book)
-                flight_url_logger.info("Logo URL extracted successfully.")
-                booking_option["provider"] = await extract_booking_name(
-                    book,
-                    "//div[@class='ogfYpf AdWm1c' and contains(normalize-space(.), 'Book ') and contains(normalize-space(.), ' with')]",
-                    r"Book\s+with\s+(.+)"
-                )
-                flight_url_logger.info("Provider name extracted successfully.")
-                booking_option["price"] = await extract_price(book)
-                flight_url_logger.info("Price extracted successfully.")
-                # Click and capture booking URL
-                btn = book.locator(ctn_selector).first
-                new_page = None
-                try:
-                    async with page.context.expect_page(timeout=3000) as w:
-                        await btn.click()
-                    new_page = await w.value
-                except PlaywrightTimeoutError:
+            try:
+                book = booking_cards.nth(idx)
+
+                # Try continue/go to site/book buttons
+                has_ctn = await wait_for_element_to_appear(book, _CTN_BUTTON_SEL)
+
+                card = prefetched[idx]
+                name_text = card["name"].translate(_NBSP_TABLE)
+                booking_option = {
+                    "logo_url": card["logo"],
+                    "price": card["price"].translate(_NBSP_TABLE) or "Visit site for price",
+                }
+
+                if has_ctn:
+                    match = _BOOK_WITH_RE.search(name_text)
+                    booking_option["provider"] = match.group(1).strip() if match else None
+                    # Click and capture booking URL
+                    btn = book.locator(_CTN_BUTTON_SEL).first
+                    # Some provider buttons are plain anchors: reading the target
+                    # is one protocol call and skips the whole popup navigation.
+                    href = await btn.get_attribute("href") or await btn.get_attribute("data-url")
+                    if href and href.startswith("http"):
+                        booking_option["booking_url"] = href
+                        booking_options.append(booking_option)
+                        flight_url_logger.info("Booking URL read directly from button attribute.")
+                        continue
+                    new_page = None
                     try:
-                        await asyncio.wait_for(page.wait_for_load_state("domcontentloaded"), timeout=8000)
-                    except asyncio.TimeoutError:
-                        pass
-
-                if new_page:
-                    await new_page.wait_for_load_state("load")
-                    await asyncio.sleep(popup_wait_ms / 1000)
-                    booking_option["booking_url"] = new_page.url
-                    flight_url_logger.info(f"Booking URL extracted successfully")
-                    await new_page.close()
-                else:
-                    await asyncio.sleep(popup_wait_ms / 1000)
-                    booking_option["booking_url"] = page.url
-                    await page.go_back()
-                    flight_url_logger.info("Returned to the main page after no popup appeared.")
-                    await wait_for_element_to_appear(page, "div.gN1nAc")
-
-            else:
-                booking_option["logo_url"] = await extract_logo_url(book)
-                flight_url_logger.info("Logo URL extracted successfully.") 
-                booking_option["provider"] = await extract_booking_name(
-                    book,
-                    "//div[@class='ogfYpf AdWm1c' and contains(normalize-space(.), 'Call ') and contains(normalize-space(.), ' to book')]",
-                    r"Call\s+(.+)\s+to\s+book"
-                )
-                flight_url_logger.info("Provider name extracted successfully.")
-                booking_option["price"] = await extract_price(book)
-                flight_url_logger.info("Price extracted successfully.")
-                booking_option["call_number"] = await book.locator("div.bcmwcd").inner_text()
-                flight_url_logger.info("Call number extracted successfully.")
+                        async with context.expect_page(timeout=3000) as w:
+                            await btn.click()
+                        new_page = await w.value
+                    except PlaywrightTimeoutError:
+                        try:
+                            await asyncio.wait_for(page.wait_for_load_state("domcontentloaded"), timeout=8000)
+                        except asyncio.TimeoutError:
+                            pass
+
+                    if new_page:
+                        popup_tasks.append(asyncio.create_task(
+                            _resolve_popup_url(new_page, booking_option, popup_wait_ms, popup_sem)
+                        ))
+                    else:
+                        try:
+                            await page.wait_for_load_state("domcontentloaded", timeout=popup_wait_ms)
+                        except PlaywrightTimeoutError:
+                            pass
+                        booking_option["booking_url"] = page.url
+                        await page.go_back()
+                        flight_url_logger.info("Returned to the main page after no popup appeared.")
+                        await wait_for_element_to_appear(page, _BOOKING_CARD_SEL)
 
-            booking_options.append(booking_option)
+                else:
+                    match = _CALL_TO_BOOK_RE.search(name_text)
+                    booking_option["provider"] = match.group(1).strip() if match else None
+                    booking_option["call_number"] = card["call"]
+
+                booking_options.append(booking_option)
+            except Exception as e:
+                flight_url_logger.warning("Skipping booking card %d: %s", idx, e)
+        if popup_tasks:
+            await asyncio.gather(*popup_tasks)
         await page.go_back()
-        flight_url_logger.info(f"Extracted {len(booking_options)} booking options successfully.")
+        flight_url_logger.info("Extracted %d booking options successfully.", len(booking_options))
     
     except Exception as e:
         booking_options = "Failed to fetch links."
@@ -559,6 +722,63 @@ async def get_flight_urls(
 # ---------- Tool-ready functions ----------
 BASE_URL = "https://www.google.com/travel/flights"
 
+# Cache of recent search results keyed by normalized search parameters.
+# Flight prices move slowly, so repeat searches within the TTL reuse the live
+# session instead of paying a full browser round-trip.
+_SEARCH_CACHE: "OrderedDict[tuple, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_SEARCH_CACHE_TTL = 900  # seconds
+_SEARCH_CACHE_MAX = 64
+
+# Agents retry get_flight_urls with identical arguments often; a short-TTL
+# cache turns the retry into a dict hit instead of a full popup harvest.
+_URLS_CACHE: "OrderedDict[tuple, Tuple[float, List[Dict[str, str]]]]" = OrderedDict()
+_URLS_CACHE_TTL = 60  # seconds
+_URLS_CACHE_MAX = 256
+
+# Re-selecting a currency the session already scraped is a full dropdown click
+# plus re-scrape plus re-parse; cache the results per (sid, currency) so the
+# repeat becomes a dict hit. Prices drift slowly, so a 10-minute TTL is safe.
+_CURRENCY_CACHE: "OrderedDict[tuple, Tuple[float, Dict[str, Any], Dict[str, Any]]]" = OrderedDict()
+_CURRENCY_CACHE_TTL = 600  # seconds
+_CURRENCY_CACHE_MAX = 64
+
+def _search_cache_key(params: FlightSearchInput) -> tuple:
+    """Build a canonical cache key from the fields that define a search."""
+    return (
+        params.origin.strip().lower(),
+        params.destination.strip().lower(),
+        params.departure_date.strip().lower(),
+        params.flight_class,
+        params.adults,
+        params.children,
+        params.infants_on_lap,
+        params.infants_in_seat,
+    )
+
+def _search_cache_get(key: tuple) -> Optional[Dict[str, Any]]:
+    """Return a cached search result if it is fresh and its session is still alive."""
+    hit = _SEARCH_CACHE.get(key)
+    if not hit:
+        return None
+    ts, result = hit
+    if time.time() - ts > _SEARCH_CACHE_TTL:
+        _SEARCH_CACHE.pop(key, None)
+        return None
+    try:
+        get_session(result["session_id"])
+    except RuntimeError:
+        _SEARCH_CACHE.pop(key, None)
+        return None
+    _SEARCH_CACHE.move_to_end(key)
+    return result
+
+def _search_cache_put(key: tuple, result: Dict[str, Any]) -> None:
+    """Store a search result, evicting the least recently used entry when full."""
+    _SEARCH_CACHE[key] = (time.time(), result)
+    _SEARCH_CACHE.move_to_end(key)
+    while len(_SEARCH_CACHE) > _SEARCH_CACHE_MAX:
+        _SEARCH_CACHE.popitem(last=False)
+
 async def search_flights_tool_fn(
     origin: str,
     destination: str,
@@ -593,38 +813,46 @@ async def search_flights_tool_fn(
             flight_class_used (str | None): Cabin actually used by Google Flights for these results.
             message (str): Status text (e.g., "Found N flights. Pick one by index (1..N).").
     """
-    params = FlightSearchInput(
-        origin=origin,
-        destination=destination,
-        departure_date=departure_date,
-        flight_class=flight_class,
-        adults=adults,
-        children=children,
-        infants_on_lap=infants_on_lap,
-        infants_in_seat=infants_in_seat,
-        headless=headless,
-        session_id=session_id,
-    )
+    params = _SEARCH_ADAPTER.validate_python({
+        "origin": origin,
+        "destination": destination,
+        "departure_date": departure_date,
+        "flight_class": flight_class,
+        "adults": adults,
+        "children": children,
+        "infants_on_lap": infants_on_lap,
+        "infants_in_seat": infants_in_seat,
+        "headless": headless,
+        "session_id": session_id,
+    })
     
+    cache_key = _search_cache_key(params)
     if params.session_id is None:
+        cached = _search_cache_get(cache_key)
+        if cached is not None:
+            logger.info("Returning cached results for an identical recent search.")
+            return cached
         sid = await create_session(headless=params.headless)
         sess = get_session(sid)
         page = sess.page
-        await page.goto(BASE_URL) # Navigate to Google Flights main page
+        await page.goto(BASE_URL, wait_until="domcontentloaded", timeout=20000) # Navigate to Google Flights main page
     else:
         sid =  params.session_id
         sess = get_session(sid)
         page = sess.page
 
     try:
-        # Click the dropdown trigger for flight type
-        await wait_for_element_to_appear(page, "div.VfPpkd-aPP78e", timeout_ms=10000)
-        await page.locator("div.VfPpkd-aPP78e").first.click()
+        # Click the dropdown trigger for flight type; locator actions
+        # auto-wait for visibility, so no explicit pre-wait is needed.
+        await page.locator("div.VfPpkd-aPP78e").first.click(timeout=10000)
 
-        # Wait for the options to appear and select the desired flight type
-        await wait_for_element_to_appear(page, "li[role='option']", timeout_ms=10000)
-        await page.wait_for_timeout(500)
-        await page.locator(f"li[role='option']:has-text('One way')").first.click()
+        # Select the desired flight type once its option renders
+        await page.locator(f"li[role='option']:has-text('One way')").first.click(timeout=10000)
+
+        # First fresh session to get this far has the consent modal resolved;
+        # snapshot its state so every later context skips that bootstrapping.
+        if params.session_id is None:
+            await save_session_state(sid)
 
         # Set number of passengers (only if different from default)
         if params.adults > 1 or params.children > 0 or params.infants_on_lap > 0 or params.infants_in_seat > 0:
@@ -638,14 +866,24 @@ async def search_flights_tool_fn(
         else:
             logger.info("Flight class is Economy, no selection needed.")
         
+        # The two autocomplete dropdowns are mutually exclusive: focusing the
+        # destination input dismisses the origin's suggestion list (and vice
+        # versa), so running the fills concurrently made whichever confirmed
+        # second wait on a dropdown that was already closed. Keep them
+        # sequential so each field's suggestion click lands before the other
+        # field takes focus.
         await fill_origin(page, params.origin)
         await fill_destination(page, params.destination)
-        
+
         await set_dates(page, params.departure_date)
 
         # Get departing flights
         departing_res, flight_class_used, currency = await get_flights(page)
-        parsed_flights = parse_flight_results(departing_res, currency)
+        # Regex-heavy and pure CPU: run on the default executor so the event
+        # loop can keep serving other sessions' Playwright traffic meanwhile.
+        parsed_flights = await asyncio.get_running_loop().run_in_executor(
+            None, parse_flight_results, departing_res, currency
+        )
 
         if not parsed_flights:
             await close_session(sid)
@@ -657,20 +895,39 @@ async def search_flights_tool_fn(
                 "message": "No flights found for the given criteria."
             }
 
-        sess.data["currency"] = currency
+        sess.currency = currency
+        # A re-search on an existing session replaces its flights; drop any
+        # currency conversions cached against the previous result set so a
+        # stale hit cannot restore the old flights onto the session.
+        for key in [k for k in _CURRENCY_CACHE if k[0] == sid]:
+            del _CURRENCY_CACHE[key]
+        # Likewise for cached booking options: flight_no indexes into the new
+        # flight list now, so offers captured for the old list are wrong.
+        for key in [k for k in _URLS_CACHE if k[0] == sid]:
+            del _URLS_CACHE[key]
+        # And for earlier searches cached against this session: their flight
+        # lists no longer match what the session holds, so a repeat of those
+        # parameters must not serve them. The key being written stays.
+        for key in [
+            k for k, (_, res) in _SEARCH_CACHE.items()
+            if res.get("session_id") == sid and k != cache_key
+        ]:
+            del _SEARCH_CACHE[key]
         # store RAW in session so get_flight_urls_tool can be used without large payload
-        sess.data["raw_flights"] = departing_res
+        sess.raw_flights = departing_res
         # store parsed flights too for reference and select_currency_tool
-        sess.data["parsed_flights"] = parsed_flights
-        sess.data["flight_class_used"] = flight_class_used
+        sess.parsed_flights = parsed_flights
+        sess.flight_class_used = flight_class_used
 
-        return {
+        result = {
             "session_id": sid,
             "flights": parsed_flights,
             "flight_class_used": flight_class_used,
             "currency": currency,
         }
-        
+        _search_cache_put(cache_key, result)
+        return result
+
     except Exception:
         try: await close_session(sid)
         except: pass
@@ -687,7 +944,8 @@ async def get_flight_urls_tool_fn(session_id: str,
 
     Args:
         session_id (str): Session id returned by `search_flights_tool_fn`.
-        flight_no (str): 1-based index of the flight to open. Default 1.
+        flight_no (int | str): 1-based index of the flight to open; strings are
+                                coerced to int by the schema. Default 1.
         max_providers (int | None): Maximum number of booking providers to return. Default 5.
         popup_wait_timeout (int): Milliseconds to wait after a new tab/pop-up appears
                                     before reading its URL. Default 10000.
@@ -704,25 +962,42 @@ async def get_flight_urls_tool_fn(session_id: str,
         RuntimeError: If the session has no `raw_flights` (you must run search first).
         ValueError: If `flight_no` does not correspond to any parsed flight.
     """
-    params = GetFlightURLsInput(
-        session_id=session_id,
-        flight_no=flight_no,
-        max_providers=max_providers,
-        popup_wait_timeout=popup_wait_timeout,
-    )
+    params = _GFU_ADAPTER.validate_python({
+        "session_id": session_id,
+        "flight_no": flight_no,
+        "max_providers": max_providers,
+        "popup_wait_timeout": popup_wait_timeout,
+    })
+    # Fail on a stale sid before touching any session attributes; agents
+    # retry with dead ids often enough for the early exit to matter.
+    if not session_exists(params.session_id):
+        raise ValueError(f"Unknown session {params.session_id}. Run search_flights first.")
     sess = get_session(params.session_id)
-    page = sess.page
-    raw = sess.data.get("raw_flights")
+    raw = sess.raw_flights
     if not raw:
         raise RuntimeError("Missing raw_flights in session. Run search_flights first.")
 
-    return await get_flight_urls(
-        page,
+    cache_key = (params.session_id, params.flight_no, params.max_providers)
+    hit = _URLS_CACHE.get(cache_key)
+    if hit is not None and time.monotonic() - hit[0] < _URLS_CACHE_TTL:
+        _URLS_CACHE.move_to_end(cache_key)
+        flight_url_logger.info("Returning cached booking options for a repeated call.")
+        return hit[1]
+
+    result = await get_flight_urls(
+        sess.context,
         raw,
         flight_no=params.flight_no,
         max_providers=params.max_providers,
         popup_wait_ms=params.popup_wait_timeout,
+        main_page=sess.page,
     )
+    if isinstance(result, list):
+        _URLS_CACHE[cache_key] = (time.monotonic(), result)
+        _URLS_CACHE.move_to_end(cache_key)
+        if len(_URLS_CACHE) > _URLS_CACHE_MAX:
+            _URLS_CACHE.popitem(last=False)
+    return result
     
 currency_logger = setup_logger(name="select_currency", log_level="INFO")
 async def select_currency_tool_fn(currency: str, session_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
@@ -734,62 +1009,86 @@ async def select_currency_tool_fn(currency: str, session_id: Optional[str] = Non
         Optional[Dict[str, Any]]: A dictionary containing:
             flight results (Dict[str, Any]): Flights search results containing price, airline, number of stops, etc.
     """
-    params = SelectCurrencyInput(
-        session_id=session_id,
-        currency=currency,
-    )
+    params = _CURRENCY_ADAPTER.validate_python({
+        "session_id": session_id,
+        "currency": currency,
+    })
+    # Use the normalized code ("usd " -> "USD") everywhere below so the
+    # short-circuit and cache keys never miss on case/whitespace.
+    currency = params.currency
 
     if params.session_id is None:
         sid = await create_session(headless=True)
         sess = get_session(sid)
         page = sess.page
-        await page.goto(BASE_URL) # Navigate to Google Flights main page
+        await page.goto(BASE_URL, wait_until="domcontentloaded", timeout=20000) # Navigate to Google Flights main page
     else:
         sid =  params.session_id
         sess = get_session(sid)
         page = sess.page
 
-    old_currency = sess.data.get("currency", "unknown")
+    old_currency = sess.currency or "unknown"
     if old_currency == currency:
-        currency_logger.info(f"Currency is already set to {currency}, no change needed.")
+        currency_logger.info("Currency is already set to %s, no change needed.", currency)
         return {
                 "session_id": sid,
-                "flights": sess.data.get("parsed_flights", None),
-                "flight_class_used": sess.data.get("flight_class_used", None),
+                "flights": sess.parsed_flights,
+                "flight_class_used": sess.flight_class_used,
                 "currency": currency,
             }
+    cache_key = (sid, currency)
+    hit = _CURRENCY_CACHE.get(cache_key)
+    if hit is not None and time.time() - hit[0] < _CURRENCY_CACHE_TTL:
+        _CURRENCY_CACHE.move_to_end(cache_key)
+        _, raw_flights, parsed_flights = hit
+        sess.raw_flights = raw_flights
+        sess.parsed_flights = parsed_flights
+        sess.currency = currency
+        currency_logger.info("Currency %s served from cache.", currency)
+        return {
+            "session_id": sid,
+            "flights": parsed_flights,
+            "flight_class_used": sess.flight_class_used or "Economy",
+            "currency": currency,
+        }
+
     try:
         currency_locator = "button[jsname='z2Jm1b']"
-        await wait_for_element_to_appear(page, currency_locator, timeout_ms=5000)
-        await page.locator(currency_locator).click()
+        await page.locator(currency_locator).click(timeout=5000)
 
-        # Wait for the options to appear and select the desired currency
-        await wait_for_element_to_appear(page, "h1:has-text('Select your currency')", timeout_ms=5000)
-        await page.locator(f"label:has-text('{currency}')").first.click()
+        # The currency label only renders once the dialog opens, so its
+        # auto-wait doubles as the dialog readiness check
+        await page.locator(f"label:has-text('{currency}')").first.click(timeout=5000)
         await page.locator("button:has-text('OK')").first.click()
         
-        currency_logger.info(f"Currency {currency} selected successfully.")
+        currency_logger.info("Currency %s selected successfully.", currency)
 
         # Wait for the page to update prices
         flight_results = {}
-        top_flights_locator = page.locator("li.pIav2d")
         currency_logger.info("Waiting for flight results to refresh with new currency...")
-        if await wait_for_element_to_appear(page, "li.pIav2d", timeout_ms=3000):
-            seen_details = set()
-            for i, flight in enumerate(await top_flights_locator.all()):
-                travel_detail = await flight.locator("div.JMc5Xc").first.get_attribute("aria-label")
-                if travel_detail not in seen_details:
-                    flight_results[f"Flight {i+1}"] = travel_detail
-                    seen_details.add(travel_detail)
-                if i+1 >= global_limiter:
-                    break
-            
-            sess.data["raw_flights"] = flight_results
-            sess.data["currency"] = currency
-            flight_class_used = sess.data.get("flight_class_used", "Economy")
-            parsed_flights = parse_flight_results(flight_results, currency)
+        if await wait_for_element_to_appear(page, _FLIGHT_CARD_SEL, timeout_ms=3000):
+            # One evaluate_all reads every card's aria-label in a single
+            # round-trip; iterating locator.all() would cost one per card.
+            labels = await page.locator(f"{_FLIGHT_CARD_SEL} div.JMc5Xc").evaluate_all(
+                "els => els.map(e => e.getAttribute('aria-label'))"
+            )
+            # dict.fromkeys dedupes in C while keeping first-seen order.
+            unique = list(dict.fromkeys(l for l in labels if l))[:_DEFAULT_LIMITER]
+            flight_results = {f"Flight {i+1}": detail for i, detail in enumerate(unique)}
+
+            sess.raw_flights = flight_results
+            sess.currency = currency
+            flight_class_used = sess.flight_class_used or "Economy"
+            parsed_flights = await asyncio.get_running_loop().run_in_executor(
+                None, parse_flight_results, flight_results, currency
+            )
             currency_logger.info("Flight results has been recovered to fit preferred currency")
 
+            _CURRENCY_CACHE[cache_key] = (time.time(), flight_results, parsed_flights)
+            _CURRENCY_CACHE.move_to_end(cache_key)
+            while len(_CURRENCY_CACHE) > _CURRENCY_CACHE_MAX:
+                _CURRENCY_CACHE.popitem(last=False)
+
             return {
                 "session_id": sid,
                 "flights": parsed_flights,
@@ -801,20 +1100,28 @@ async def select_currency_tool_fn(currency: str, session_id: Optional[str] = Non
             currency_logger.info("Reverting to previous flight results.")
             return {
                 "session_id": sid,
-                "flights": sess.data.get("parsed_flights", None),   
-                "flight_class_used": sess.data.get("flight_class_used", None),
+                "flights": sess.parsed_flights,   
+                "flight_class_used": sess.flight_class_used,
                 "currency": currency,
             }
 
     except Exception as e:
-        currency_logger.exception(f"Error selecting currency: {e}")
+        currency_logger.exception("Error selecting currency: %s", e)
         # raise
 
 
+# Strong references to in-flight close tasks; without them the event loop
+# may garbage-collect a task before the context teardown finishes.
+_REAPERS: set = set()
+
 async def close_session_tool_fn(session_id: str) -> Dict[str, Any]:
     """
     Close and dispose a previously created Playwright session.
 
+    The teardown (context close + storage-state flush) runs as a background
+    task: the caller gets its confirmation immediately instead of waiting
+    hundreds of ms for process cleanup, and the reply is the same either way.
+
     Args:
         session_id (str): The id of the session to close.
 
@@ -822,18 +1129,82 @@ async def close_session_tool_fn(session_id: str) -> Dict[str, Any]:
         Dict[str, Any]: A dictionary with a single key:
             messages (str): A message indicating the session has been closed.
     """
-    params = CloseSessionInput(session_id=session_id)
-    await close_session(params.session_id)
+    # A single trusted string needs no model round-trip.
+    for key in [k for k in _URLS_CACHE if k[0] == session_id]:
+        del _URLS_CACHE[key]
+    for key in [k for k in _CURRENCY_CACHE if k[0] == session_id]:
+        del _CURRENCY_CACHE[key]
+    task = asyncio.create_task(close_session(session_id))
+    _REAPERS.add(task)
+    task.add_done_callback(_REAPERS.discard)
     return {"messages": "Session closed."}
 
 
+async def search_flights_batch(items: List[Dict[str, Any]], concurrency: int = 5) -> List[Any]:
+    """
+    Run several flight searches concurrently with a bounded semaphore.
+
+    Each item is a kwargs dict for `search_flights_tool_fn`. Searches share
+    the warm browser, so N items cost roughly ceil(N / concurrency) searches
+    of wall time; a failed item yields its exception in place rather than
+    poisoning the rest of the batch.
+
+    Args:
+        items (List[Dict[str, Any]]): Keyword-argument dicts, one per search.
+        concurrency (int): Maximum simultaneous searches. Defaults to 5.
+
+    Returns:
+        List[Any]: Per-item results (or exceptions), in input order.
+    """
+    sem = asyncio.Semaphore(concurrency)
+
+    async def _run(kwargs: Dict[str, Any]):
+        async with sem:
+            return await search_flights_tool_fn(**kwargs)
+
+    return await asyncio.gather(*(_run(item) for item in items), return_exceptions=True)
+
+
+@asynccontextmanager
+async def session_scope(currency: Optional[str] = None):
+    """
+    Open a Playwright session, yield its sid, and always close it on exit.
+
+    Guarantees the context (and its Chromium helper processes) are reaped
+    even when a step inside the block raises, which a manual try/finally
+    only covers once the sid has been assigned.
+    """
+    sid = None
+    try:
+        # Create the session ourselves before any tool call: sid is assigned
+        # first, so the finally below reaps it even if currency selection
+        # fails (select_currency_tool_fn swallows scrape errors and returns
+        # None rather than raising).
+        sid = await create_session()
+        if currency is not None:
+            # Same landing the tool performs for sessions it creates itself:
+            # the currency dialog only exists on the Google Flights page.
+            page = get_session(sid).page
+            await page.goto(BASE_URL, wait_until="domcontentloaded", timeout=20000)
+            await select_currency_tool_fn(currency=currency, session_id=sid)
+        yield sid
+    finally:
+        if sid:
+            # Close synchronously rather than via close_session_tool_fn's
+            # fire-and-forget task: the context manager promises the session
+            # is gone when the block exits, and a caller's event loop (e.g.
+            # asyncio.run in the demo below) may stop before a background
+            # teardown ever runs.
+            for key in [k for k in _URLS_CACHE if k[0] == sid]:
+                del _URLS_CACHE[key]
+            for key in [k for k in _CURRENCY_CACHE if k[0] == sid]:
+                del _CURRENCY_CACHE[key]
+            await close_session(sid)
+
+
 if __name__ == "__main__":
     async def _demo():
-        sid = None
-        try:
-            res = await select_currency_tool_fn(currency="USD")
-
-            sid = res["session_id"]
+        async with session_scope(currency="USD") as sid:
             print(f"Session ID used by select_currency_tool: {sid}")
             res = await search_flights_tool_fn(
                 origin="Seoul",
@@ -847,7 +1218,7 @@ if __name__ == "__main__":
                 headless=True,
                 session_id=sid,
             )
-            
+
             print(f"Session ID used by search_flights_tool: {res['session_id']}")
             print(res["flights"])
 
@@ -864,8 +1235,5 @@ if __name__ == "__main__":
                 max_providers=3,
                 popup_wait_timeout=5000,
             ))
-        finally:
-            if sid:
-                await close_session_tool_fn(session_id=sid)
 
     asyncio.run(_demo())
@@ -22,7 +22,14 @@ def setup_logger(
         backup_count: Number of backup files to keep (default: 3)
     """
     logger = logging.getLogger(name)
+    # Loggers are process-global; repeat setup calls for the same name
+    # (re-imports, hot reload) would stack handlers and emit every line
+    # N times. Return the already-configured instance instead.
+    if logger.handlers:
+        return logger
     logger.setLevel(getattr(logging, log_level.upper()))
+    # Handlers are attached directly, so don't bubble to root too.
+    logger.propagate = False
 
     # Formatter
     formatter = logging.Formatter(
@@ -1,5 +1,5 @@
 from typing import Optional, Literal
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 
 class FlightSearchInput(BaseModel):
     origin: str = Field(
@@ -20,14 +20,40 @@ class FlightSearchInput(BaseModel):
     session_id: Optional[str] = None
 
 class GetFlightURLsInput(BaseModel):
+    # Built fresh on every tool call and never mutated; frozen=True lets
+    # pydantic-core use its immutable-model fast path.
+    model_config = ConfigDict(frozen=True)
+
     session_id: Optional[str]
-    flight_no: Optional[int|str] = 1
+    flight_no: int = Field(1, ge=1)
     max_providers: Optional[int] = 5
     popup_wait_timeout: int = 10000
 
+    @field_validator("flight_no", mode="before")
+    @classmethod
+    def _coerce_flight_no(cls, v):
+        # The demo/UI sends the 1-based index as a string; coerce it here so
+        # downstream code and cache keys always see an int.
+        if isinstance(v, str):
+            return int(v.strip())
+        return 1 if v is None else v
+
 class SelectCurrencyInput(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     session_id: Optional[str]
     currency: str
-    
+
+    @field_validator("currency", mode="before")
+    @classmethod
+    def _normalize_currency(cls, v):
+        # Normalize "usd " -> "USD" so the already-set short-circuit in the
+        # tool compares like with like instead of re-scraping.
+        if isinstance(v, str):
+            return v.strip().upper()
+        return v
+
 class CloseSessionInput(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     session_id: Optional[str]
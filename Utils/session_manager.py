@@ -1,80 +1,291 @@
 from __future__ import annotations
+from contextvars import ContextVar
+from dataclasses import dataclass
 from uuid import uuid4
 from typing import Any, Dict, Optional
-from pydantic import BaseModel
 import asyncio
-try:
-    from pydantic import ConfigDict   # Pydantic v2
-    _V2 = True
-except Exception:
-    _V2 = False
+import os
+import time
 
 from playwright.async_api import async_playwright, Playwright, Browser, BrowserContext, Page # type: ignore
 
 
-class PWSession(BaseModel):
+@dataclass(slots=True)
+class PWSession:
     """
     Single Playwright session container.
     Keeps references to the Playwright driver, the browser, its context, the page,
-    plus a small 'data' dict for any session-scoped metadata you want to cache.
+    plus typed slots for the search results the tools cache between calls.
+
+    A plain slotted dataclass rather than a Pydantic model: the fields are
+    trusted internal handles that need no validation, and slot access keeps
+    per-session memory and attribute lookups cheap when many sessions live.
 
     Fields:
-      sid:      Unique identifier for this session (UUID string).
+      sid:      Unique identifier for this session (32-char uuid4 hex string).
       browser:  The launched Chromium/Firefox/WebKit browser instance.
       context:  The BrowserContext created for this session.
       page:     The active Page within the context.
       p:        The top-level Playwright controller (from async_playwright().start()).
-      data:     Free-form dict to store session-related data (inputs, preferences, etc).
+      raw_flights:       Raw aria-label texts from the last search, keyed by flight.
+      parsed_flights:    Structured results parsed from raw_flights.
+      flight_class_used: Cabin Google Flights actually returned results for.
+      currency:          Currency symbol detected on the results page.
     """
-    if _V2:
-        model_config = ConfigDict(arbitrary_types_allowed=True)
-    else:
-        class Config:
-            arbitrary_types_allowed = True
-
     sid: str
     browser: Browser
     context: BrowserContext
     page: Page
     p: Optional[Playwright] = None
-    data: Dict[str, Any] = {}
+    raw_flights: Optional[Dict[str, Any]] = None
+    parsed_flights: Optional[Dict[str, Any]] = None
+    flight_class_used: Optional[str] = None
+    currency: Optional[str] = None
+
+
+# Resource types aborted by the context route handler to cut page-load bytes.
+_BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+
+# Scrape-only Chromium flags: no GPU, no background throttling of the tab
+# we are actively reading, and /dev/shm avoidance for container deployments.
+_LAUNCH_ARGS = [
+    "--disable-dev-shm-usage",
+    "--disable-gpu",
+    "--disable-background-timer-throttling",
+    "--disable-renderer-backgrounding",
+]
+
+# Persisted cookies/localStorage so later runs skip Google's consent modal and
+# A/B bootstrapping. Saved when a session closes, loaded into new contexts.
+_STATE_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gflights_state.json"
+)
+# Snapshots older than a day are ignored and rewritten: Google rotates
+# consent/A-B cookies, and seeding a context with expired state can be
+# slower than starting cold.
+_STATE_MAX_AGE = 24 * 3600
+
+
+def _state_file_fresh() -> bool:
+    """Return True when the storage-state snapshot exists and is under a day old."""
+    try:
+        return (time.time() - os.path.getmtime(_STATE_FILE)) < _STATE_MAX_AGE
+    except OSError:
+        return False
+
+
+async def _write_state_snapshot(context: BrowserContext) -> None:
+    """
+    Write the context's storage state to _STATE_FILE atomically.
 
+    Several sessions may close concurrently (close_all_sessions gathers its
+    teardowns), so writing the shared path directly could interleave two
+    snapshots into an unparseable file. Write to a unique temp file in the
+    same directory and rename it into place; os.replace is atomic, so
+    readers only ever see a complete snapshot.
+    """
+    tmp = f"{_STATE_FILE}.{uuid4().hex}.tmp"
+    try:
+        await context.storage_state(path=tmp)
+        os.replace(tmp, _STATE_FILE)
+    finally:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
 
 _SESSIONS: Dict[str, PWSession] = {}
 _PLAY: Optional[Playwright] = None
+_BROWSERS: Dict[bool, Browser] = {}  # one shared browser per headless flag
+# Launch time and contexts-served per shared browser, used for recycling.
+_BROWSER_META: Dict[bool, Dict[str, float]] = {}
+# Long-lived Chromium processes slowly accumulate renderer memory; retire a
+# shared browser after this many contexts or this age, but only once no live
+# session still runs on it.
+_BROWSER_MAX_CONTEXTS = 50
+_BROWSER_MAX_AGE = 900  # seconds
 _LOCK = asyncio.Lock()
 
 async def _ensure_playwright() -> Playwright:
-    """Ensure that the global Playwright driver is started and return it."""
+    """Ensure that the global Playwright driver is started and return it.
+
+    Double-checked so the common call is a plain attribute read; only the
+    first caller ever awaits under the lock.
+    """
     global _PLAY
     if _PLAY is None:
-        _PLAY = await async_playwright().start()
+        async with _LOCK:
+            if _PLAY is None:
+                _PLAY = await async_playwright().start()
     return _PLAY
 
-async def create_session(headless: bool = True) -> str:
+def _browser_worn(meta: Dict[str, float]) -> bool:
+    """True once a shared browser has served enough contexts or aged out."""
+    return (
+        meta["contexts"] >= _BROWSER_MAX_CONTEXTS
+        or time.time() - meta["started"] >= _BROWSER_MAX_AGE
+    )
+
+async def _ensure_browser(headless: bool = True) -> Browser:
+    """
+    Ensure a shared browser for the given headless mode is launched and return it.
+
+    Launching Chromium costs ~1-2s; reusing one browser across sessions and
+    handing out cheap BrowserContexts amortizes that cost to the first call.
+    The healthy-browser fast path runs without the lock; only launch and
+    recycle are serialized.
+    """
+    PLAY = await _ensure_playwright()
+    browser = _BROWSERS.get(headless)
+    meta = _BROWSER_META.get(headless)
+    if browser is not None and browser.is_connected() and meta is not None and not _browser_worn(meta):
+        return browser
+    async with _LOCK:
+        # Re-check under the lock: another task may have relaunched already.
+        browser = _BROWSERS.get(headless)
+        meta = _BROWSER_META.get(headless)
+        if browser is not None and browser.is_connected() and meta is not None:
+            # A creation in flight has the browser handle but no registered
+            # session yet (create_session registers last), so the _SESSIONS
+            # scan alone can't protect it; the inflight pin does.
+            if (
+                _browser_worn(meta)
+                and not meta.get("inflight")
+                and not any(s.browser is browser for s in _SESSIONS.values())
+            ):
+                try:
+                    await browser.close()
+                except Exception:
+                    pass
+                browser = None
+        if browser is None or not browser.is_connected():
+            browser = await PLAY.chromium.launch(headless=headless, args=_LAUNCH_ARGS)
+            _BROWSERS[headless] = browser
+            _BROWSER_META[headless] = {"started": time.time(), "contexts": 0, "inflight": 0}
+        return browser
+
+async def warmup(headless: bool = True) -> None:
+    """
+    Launch the shared Playwright driver and browser ahead of traffic.
+
+    Call from the app's startup hook so the first search request pays only
+    for a new context instead of the multi-second Chromium cold start.
+    """
+    await _ensure_browser(headless=headless)
+
+async def create_session(headless: bool = True, block_assets: bool = True) -> str:
     """
     Create and register a new Playwright session and return its session id (sid).
 
     Steps:
-      1) Start Playwright (async_playwright().start()).
-      2) Launch a new browser (Chromium by default).
-      3) Create a fresh BrowserContext and Page.
-      4) Generate a UUID sid and store everything in SESSIONS[sid].
+      1) Ensure the shared Playwright driver and browser are running.
+      2) Create a fresh BrowserContext and Page on the shared browser.
+      3) Generate a uuid4-hex sid and store everything in SESSIONS[sid].
 
     Args:
-      headless: Whether to launch the browser in headless mode.
+      headless: Whether the shared browser should run in headless mode.
+      block_assets: Abort image/font/media requests to cut page-load bytes.
+        Disable when debugging a session visually.
 
     Returns:
-      str: The newly created session id (UUID string).
+      str: The newly created session id (uuid4 hex string).
     """
-    async with _LOCK:
-        PLAY = await _ensure_playwright()
-        browser = await PLAY.chromium.launch(headless=headless)
-        context = await browser.new_context()
+    # No global lock here: _ensure_browser serializes launch/recycle, and the
+    # dict store at the end is atomic under the GIL. Concurrent create_session
+    # calls build their contexts in parallel.
+    browser = await _ensure_browser(headless=headless)
+    # Pin this creation: the session is registered only at the end, so until
+    # then the recycler's _SESSIONS scan cannot see that the browser is in
+    # use. The bump happens before the next await, so the recycler (which
+    # runs on the same loop) always observes it.
+    meta = _BROWSER_META[headless]
+    meta["inflight"] += 1
+    try:
+        try:
+            context = await browser.new_context(
+                storage_state=_STATE_FILE if _state_file_fresh() else None,
+                viewport={"width": 1280, "height": 900},
+                # Belt and braces with the CDP bypass below: "block" covers the
+                # non-Chromium case and stops workers from ever registering.
+                service_workers="block",
+            )
+        except Exception:
+            if not _state_file_fresh():
+                raise
+            # A corrupt or unreadable snapshot must not block session creation
+            # until it ages out; drop it and start the context cold instead.
+            # One retry only, and on a re-resolved browser: the failure may
+            # just as well mean the shared browser died under us.
+            try:
+                os.remove(_STATE_FILE)
+            except OSError:
+                pass
+            if not browser.is_connected():
+                meta["inflight"] -= 1
+                browser = await _ensure_browser(headless=headless)
+                meta = _BROWSER_META[headless]
+                meta["inflight"] += 1
+            context = await browser.new_context(
+                storage_state=None,
+                viewport={"width": 1280, "height": 900},
+                service_workers="block",
+            )
+        # The scraper only reads text, so skip images/fonts/media entirely.
+        # Stylesheets stay enabled because the tools rely on visibility checks.
+        if block_assets:
+            await context.route(
+                "**/*",
+                lambda route: route.abort()
+                if route.request.resource_type in _BLOCKED_RESOURCE_TYPES
+                else route.continue_(),
+            )
         page = await context.new_page()
-        sid = str(uuid4())
-        _SESSIONS[sid] = PWSession(sid=sid, p=PLAY, browser=browser, context=context, page=page, data={})
+        # Bypass service workers so Google's prefetch/offline machinery adds
+        # no network churn while results are scraped; the HTTP cache stays on.
+        try:
+            cdp = await context.new_cdp_session(page)
+            await cdp.send("Network.enable")
+            await cdp.send("Network.setBypassServiceWorker", {"bypass": True})
+        except Exception:
+            pass  # CDP is Chromium-only; the session works fine without it
+        meta["contexts"] += 1
+        # .hex keeps the full 128 bits but drops the hyphens: shorter dict keys
+        # and fewer bytes through every JSON/tool boundary the sid crosses.
+        sid = uuid4().hex
+        _SESSIONS[sid] = PWSession(sid=sid, p=_PLAY, browser=browser, context=context, page=page)
         return sid
+    finally:
+        meta["inflight"] -= 1
+
+
+async def save_session_state(sid: str, force: bool = False) -> None:
+    """
+    Snapshot a session's cookies/localStorage into the shared state file.
+
+    New contexts clone this snapshot (see create_session), so one warmed-up
+    session lets every later search skip Google's consent modal and most
+    first-visit bootstrapping. Writes only when the file is missing unless
+    force=True; failures are swallowed since the snapshot is an optimization.
+    """
+    sess = _SESSIONS.get(sid)
+    if not sess:
+        return
+    if not force and _state_file_fresh():
+        return
+    try:
+        await _write_state_snapshot(sess.context)
+    except Exception:
+        pass
+
+# Last session resolved by the current async task. Tool chains typically hit
+# the same sid several times back to back; the memo skips the registry lookup
+# without ever outliving a close (see close_session).
+_LAST_SESSION: ContextVar[Optional[PWSession]] = ContextVar("pw_last_session", default=None)
+
+
+def session_exists(sid: str) -> bool:
+    """O(1) membership check: True while the sid is still registered."""
+    return sid in _SESSIONS
 
 
 def get_session(sid: str) -> PWSession:
@@ -87,37 +298,54 @@ def get_session(sid: str) -> PWSession:
     Returns:
       PWSession: The live session object.
     """
+    cached = _LAST_SESSION.get()
+    if cached is not None and cached.sid == sid and sid in _SESSIONS:
+        return cached
     sess = _SESSIONS.get(sid)
     if not sess:
         raise RuntimeError("Session not found or expired. Run search first.")
+    _LAST_SESSION.set(sess)
     return sess
 
 async def close_session(sid: str) -> None:
     """
     Close and remove a session by sid but do not stop global driver.
 
-    This attempts to:
-      - Close the browser (which also closes all contexts/pages).
-      - Stop the Playwright driver (p.stop()) in a 'finally' so it always runs.
+    Only the session's BrowserContext is closed; the shared browser and the
+    Playwright driver stay alive so later sessions skip the launch cost.
     Args:
       sid: The session id to close. If it doesn’t exist, this is a no-op.
     """
-    async with _LOCK:
-        sess =  _SESSIONS.pop(sid, None)
+    # dict.pop is atomic under the GIL; no lock needed for unrelated sids.
+    sess = _SESSIONS.pop(sid, None)
+    cached = _LAST_SESSION.get()
+    if cached is not None and cached.sid == sid:
+        _LAST_SESSION.set(None)
     if not sess:
         return
-    try:
-        await sess.browser.close()
-    finally:
-        await sess.p.stop()
-
-async def close_all_sessions() -> None:
-    """Close all live sessions. Safe to call repeatedly."""
-    for sid in list(_SESSIONS.keys()):
+    # Same freshness gate as save_session_state: when the snapshot is
+    # already current there is nothing to gain from rewriting it, and
+    # skipping the write keeps concurrent closes from racing each other.
+    if not _state_file_fresh():
         try:
-            await close_session(sid)
+            await _write_state_snapshot(sess.context)
         except Exception:
             pass
+    await sess.context.close()
+
+async def close_all_sessions() -> None:
+    """Close all live sessions and the shared browser(s). Safe to call repeatedly."""
+    # Contexts are independent, so tear them down concurrently; shutdown cost
+    # becomes one teardown instead of one per session.
+    await asyncio.gather(
+        *(close_session(sid) for sid in list(_SESSIONS.keys())),
+        return_exceptions=True,
+    )
+    await asyncio.gather(
+        *(browser.close() for browser in list(_BROWSERS.values())),
+        return_exceptions=True,
+    )
+    _BROWSERS.clear()
     global _PLAY
     if _PLAY:
         try:
@@ -132,20 +360,16 @@ def close_all_sessions_sync(timeout: float | None = None) -> None:
     so Playwright is shut down before the process exits.
     """
     try:
-        loop = asyncio.get_event_loop()
+        loop = asyncio.get_running_loop()
     except RuntimeError:
         loop = None
 
-    if loop and loop.is_running():
-        fut = asyncio.run_coroutine_threadsafe(close_all_sessions(), loop)
-        try:
-            fut.result(timeout or 5)
-        except Exception:
-            pass
-    else:
-        loop = loop or asyncio.new_event_loop()
-        try:
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(close_all_sessions())
-        finally:
-            loop.close()
+    if loop is not None:
+        # A loop is already running in this thread; schedule on it and let it
+        # drain rather than blocking the handler.
+        loop.create_task(close_all_sessions())
+        return
+    try:
+        asyncio.run(asyncio.wait_for(close_all_sessions(), timeout or 5))
+    except Exception:
+        pass
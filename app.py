@@ -1,78 +1,165 @@
-import asyncio, os, sys, signal
-from flask import Flask, request, jsonify, render_template
-from flask_cors import CORS
-from Agent.llm import agent, collector
-from threading import Thread
-from flask import Blueprint, request, jsonify
+import asyncio, hashlib, os, sys, signal, time
+from collections import OrderedDict
+from typing import Optional, Tuple
+import orjson
+from quart import Quart, Response, request, render_template, Blueprint
+from Agent.llm import agent, ToolEventCollector
+from Agent.batcher import submit as agent_submit
 from uuid import uuid4
 from werkzeug.exceptions import BadRequest
-from Tools.search_flights import search_flights_tool_fn, get_flight_urls_tool_fn, select_currency_tool_fn, close_session_tool_fn
-from Utils.session_manager import close_all_sessions_sync
+from Tools.search_flights import (
+    search_flights_tool_fn,
+    get_flight_urls_tool_fn,
+    select_currency_tool_fn,
+    close_session_tool_fn,
+    parse_dates,
+)
+from Utils.session_manager import close_all_sessions, close_all_sessions_sync, session_exists, warmup as warmup_browser
 from Utils.logger import setup_logger
 
 logger = setup_logger(name="app_chat")
 
-app = Flask(__name__)
-app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
+def ojson(obj, status: int = 200) -> Response:
+    """JSON response serialized with orjson; markedly faster than the stdlib
+    encoder on the nested agent/flight payloads these endpoints return."""
+    return Response(
+        orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS),
+        status=status,
+        mimetype="application/json",
+    )
 
-CORS(app)
+app = Quart(__name__)
 
 api = Blueprint("api", __name__, url_prefix="/api")
 
-_LOOP = asyncio.new_event_loop()
-def _loop_forever():
-    """
-    Run the global asyncio event loop forever in a dedicated background thread.
-
-    This process-wide loop is used to execute async coroutines (e.g., Playwright tools)
-    from sync Flask endpoints via `run_coro()`. The loop is set on this thread and kept
-    alive for the lifetime of the process.
-    """
-    asyncio.set_event_loop(_LOOP)
-    _LOOP.run_forever()
-
-Thread(target=_loop_forever, daemon=True).start()
-
-def run_coro(coro, timeout=120):
-    """
-    Run an asyncio coroutine on the background event loop and wait for the result.
-
-    Args:
-        coro: The coroutine object to execute.
-        timeout (int|float): Max seconds to wait for the result before raising TimeoutError.
-
-    Returns:
-        Any: The coroutine's return value.
+async def parse_body() -> dict:
+    """Read and orjson-decode the request body in one pass.
 
-    Raises:
-        concurrent.futures.TimeoutError: If result is not available within `timeout`.
-        Exception: Any exception raised inside the coroutine is propagated.
+    Replaces request.get_json(silent=True/force=True): no content-type
+    negotiation, no cached copy, and malformed or empty bodies come back as
+    {} so handlers keep their required-field checks as the single gate.
     """
-    fut = asyncio.run_coroutine_threadsafe(coro, _LOOP)
-    return fut.result(timeout=timeout)
+    raw = await request.get_data()
+    if not raw:
+        return {}
+    try:
+        body = orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        return {}
+    return body if isinstance(body, dict) else {}
+
+# Response caches for duplicate requests (UI retries, double clicks): keyed
+# by a blake2s hash of the canonicalized body, storing the serialized JSON
+# bytes so a hit skips the LLM/browser call and re-serialization entirely.
+# Chat entries include the thread_id in the hash, so only a literal repeat
+# of the same message on the same thread is served from cache. /chat is
+# stateful (every message advances the checkpointer thread), so its TTL is
+# just long enough to absorb a double click or duplicated POST — any longer
+# and a deliberate repeat like "yes" would never reach the agent.
+_CHAT_CACHE: "OrderedDict[bytes, Tuple[float, bytes]]" = OrderedDict()
+_CHAT_CACHE_TTL = 2  # seconds
+_FLIGHT_RESP_CACHE: "OrderedDict[bytes, Tuple[float, bytes, Optional[str]]]" = OrderedDict()
+_FLIGHT_RESP_CACHE_TTL = 300  # seconds
+_RESP_CACHE_MAX = 512
+
+def _body_key(payload: dict) -> bytes:
+    """Canonical cache key: blake2s over the sorted-key JSON of the body."""
+    return hashlib.blake2s(
+        orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+    ).digest()
+
+def _resp_cache_get(cache: OrderedDict, key: bytes, ttl: float):
+    hit = cache.get(key)
+    if hit is None:
+        return None
+    if time.monotonic() - hit[0] >= ttl:
+        cache.pop(key, None)
+        return None
+    cache.move_to_end(key)
+    return hit
+
+def _resp_cache_put(cache: OrderedDict, key: bytes, entry: tuple) -> None:
+    cache[key] = entry
+    cache.move_to_end(key)
+    while len(cache) > _RESP_CACHE_MAX:
+        cache.popitem(last=False)
+
+# Required-field constants hoisted out of the handlers: no per-request tuple
+# construction, and the error strings are formatted only on the failure path.
+_SEARCH_REQUIRED = ("origin", "destination", "departure_date")
+_PAX_FIELDS = ("adults", "children", "infants_on_lap", "infants_in_seat")
+_MISSING_MSG = "Missing required field: {}".format
+_MISSING_SESSION = "Missing required field: session_id"
+_MISSING_CURRENCY = "Missing required field: currency"
+
+# Admission gates: a burst queues briefly instead of oversubscribing the LLM
+# backend and the shared browser. Each permit is bounded by a wait_for so a
+# stuck call cannot pin one forever; past _MAX_QUEUE waiters we shed load
+# with a 429 rather than stacking requests that will time out anyway.
+AGENT_SEM = asyncio.Semaphore(int(os.getenv("AGENT_MAX_INFLIGHT", "4")))
+FLIGHT_SEM = asyncio.Semaphore(int(os.getenv("FLIGHT_MAX_INFLIGHT", "2")))
+_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "16"))
+_WAITERS = {"agent": 0, "flight": 0}
+
+class ServiceSaturated(Exception):
+    """Raised when an admission gate sheds load; handlers map it to HTTP 429."""
+
+async def _admit(sem: asyncio.Semaphore, kind: str, coro, timeout: float = 120):
+    """Run `coro` under `sem` with a timeout; raise ServiceSaturated when full."""
+    if sem.locked() and _WAITERS[kind] >= _MAX_QUEUE:
+        coro.close()
+        raise ServiceSaturated("Server is busy, please retry shortly.")
+    _WAITERS[kind] += 1
+    try:
+        async with sem:
+            return await asyncio.wait_for(coro, timeout=timeout)
+    finally:
+        _WAITERS[kind] -= 1
+
+# Fixed CORS header set, built once; the allowed origin is deploy-time
+# configuration, not per-request logic.
+_CORS_HDRS = {
+    "Access-Control-Allow-Origin": os.getenv("CORS_ORIGIN", "*"),
+    "Access-Control-Allow-Headers": "Content-Type",
+    "Access-Control-Allow-Methods": "GET,POST,OPTIONS",
+}
+
+@app.after_request
+async def _add_cors_headers(response):
+    """Attach the precomputed CORS headers to every response."""
+    response.headers.update(_CORS_HDRS)
+    return response
+
+@app.route("/", defaults={"_any": ""}, methods=["OPTIONS"])
+@app.route("/<path:_any>", methods=["OPTIONS"])
+async def _preflight(_any):
+    """Answer CORS preflight for any path without touching handler logic."""
+    return Response(b"", status=204, headers=_CORS_HDRS)
+
+async def _async_shutdown(sig: int):
+    """Close all Playwright sessions on the loop, then hand the signal back
+    to the server's default handling so it exits normally."""
+    try:
+        await close_all_sessions()
+    finally:
+        loop = asyncio.get_running_loop()
+        try:
+            loop.remove_signal_handler(sig)
+        except (NotImplementedError, ValueError):
+            pass
+        signal.raise_signal(sig)
 
-def _install_signal_shutdown():
+def _install_sync_signal_shutdown():
     """
-    Register signal handlers to close Playwright sessions and stop the
-    background asyncio loop before the process exits. Avoid double-registering
-    with Flask's debug reloader by only installing in the child process.
+    Fallback for platforms without loop.add_signal_handler (Windows):
+    close Playwright sessions from a classic signal handler before exit.
     """
-    # Only install in the actual serving process when debug reloader is on
-    is_reloader_child = os.environ.get("WERKZEUG_RUN_MAIN") == "true"
-    if app.debug and not is_reloader_child:
-        return
-
     def _handler(signum, frame):
         try:
-            # 1) close all Playwright sessions so the Node driver won't EPIPE
+            # close_all_sessions_sync schedules the teardown on the running
+            # loop when there is one, else drives it to completion here.
             close_all_sessions_sync()
         finally:
-            # 2) stop the background asyncio loop thread
-            try:
-                _LOOP.call_soon_threadsafe(_LOOP.stop)
-            except Exception:
-                pass
-            # 3) exit the process
             sys.exit(0)
 
     for name in ("SIGINT", "SIGTERM", "SIGBREAK"):  # SIGBREAK for Windows (Ctrl+Break)
@@ -85,64 +172,143 @@ def _install_signal_shutdown():
             # Some environments disallow setting signal handlers; ignore
             pass
 
-# >>> call it once right after the loop thread is started <<<
-_install_signal_shutdown()
+@app.before_serving
+async def _install_signal_shutdown():
+    """
+    Register shutdown handlers on the running event loop so Playwright
+    teardown can be awaited properly instead of running sync teardown inside
+    a signal context, which risks re-entering the loop.
+    """
+    loop = asyncio.get_running_loop()
+    for name in ("SIGINT", "SIGTERM"):
+        sig = getattr(signal, name, None)
+        if sig is None:
+            continue
+        try:
+            loop.add_signal_handler(
+                sig, lambda s=sig: loop.create_task(_async_shutdown(s))
+            )
+        except (NotImplementedError, RuntimeError):
+            _install_sync_signal_shutdown()
+            return
+
+@app.before_serving
+async def _warm_browser():
+    """Launch the shared Chromium before traffic so the first search request
+    pays only for a new context, not the browser cold start."""
+    try:
+        await warmup_browser(headless=True)
+    except Exception as e:
+        # Warmup is an optimization; the first request will retry the launch.
+        logger.warning(f"Browser warmup failed: {e}")
+
+# index.html takes no per-request variables, so render it once, keep the
+# bytes, and let browsers revalidate with the ETag instead of re-rendering.
+_INDEX_PAGE: dict = {}
 
 @app.route("/")
-def main():
-    """Render the main UI page (index.html)."""
-    return render_template("index.html")
+async def main():
+    """Serve the main UI page (index.html) from an in-memory render."""
+    if not _INDEX_PAGE:
+        body = (await render_template("index.html")).encode("utf-8")
+        _INDEX_PAGE["body"] = body
+        _INDEX_PAGE["etag"] = hashlib.blake2s(body).hexdigest()
+    headers = {"ETag": _INDEX_PAGE["etag"], "Cache-Control": "public, max-age=60"}
+    if request.headers.get("If-None-Match") == _INDEX_PAGE["etag"]:
+        return Response(b"", status=304, headers=headers)
+    return Response(_INDEX_PAGE["body"], mimetype="text/html", headers=headers)
 
 @app.route("/chat", methods=["POST"])
-def chat():
+async def chat():
     """
     Handle chat messages from the UI
-    
+
     Returns:
-      flask.Response: JSON response with reply/artifacts/thread_id, or a JSON error (500) on failure.
+      quart.Response: JSON response with reply/artifacts/thread_id, or a JSON error (500) on failure.
     """
-    
-    body = request.get_json(force=True) or {}
+
+    body = await parse_body()
     user_input = body.get("message", "")
+    # parse_body maps malformed JSON to {}; without this gate that became an
+    # empty message and spent a full agent invocation to say nothing.
+    if not user_input:
+        raise BadRequest("Missing required field: message")
     logger.info(f"User message : {user_input}")
 
     base_thread_id = body.get("thread_id") or request.remote_addr or "default"
-    used_thread_id = base_thread_id
-    
-    start_idx = len(collector.events)
-    
-    def _invoke(thread_id: str):    
-        config = {"thread_id": thread_id, "recursion_limit": 15, "callbacks": [collector]}
-        return run_coro(agent.ainvoke({"messages": user_input}, config=config))
-    
-    try:
-        # Attempt 1
-        resp = _invoke(used_thread_id)
-        logger.info(f"Agent reply : {resp['messages'][-1].content}")
-    except Exception as e1:
-        # Delete only created event during attempt 1
-        if len(collector.events) > start_idx:
-            del collector.events[start_idx:]
-        used_thread_id = f"{base_thread_id}-{uuid4().hex[:8]}"
-        start_idx = len(collector.events)
 
+    # Opt-in SSE streaming: events are pushed as they happen, so time to
+    # first byte drops to first-token latency instead of full-reply latency.
+    # The buffered JSON path below stays the default for the current UI.
+    if body.get("stream") in (True, 1, "1") or request.args.get("stream") == "1":
+        config = {
+            "thread_id": base_thread_id,
+            "recursion_limit": 15,
+            "callbacks": [ToolEventCollector()],
+        }
+
+        async def gen():
+            async with AGENT_SEM:
+                async for ev in agent.astream_events(
+                    {"messages": user_input}, version="v2", config=config
+                ):
+                    yield b"data: " + orjson.dumps(ev, default=str) + b"\n\n"
+            yield b"data: [DONE]\n\n"
+
+        return Response(
+            gen(),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache"},
+        )
+
+    cache_key = _body_key({"message": user_input, "thread_id": base_thread_id})
+    hit = _resp_cache_get(_CHAT_CACHE, cache_key, _CHAT_CACHE_TTL)
+    if hit is not None:
+        return Response(hit[1], mimetype="application/json")
+
+    async def _invoke(thread_id: str, events: ToolEventCollector):
+        config = {"thread_id": thread_id, "recursion_limit": 15, "callbacks": [events]}
+        # agent_submit micro-batches concurrent chats into one abatch call.
+        return await _admit(
+            AGENT_SEM, "agent",
+            agent_submit({"messages": user_input}, config),
+        )
+
+    # Attempt on the caller's thread first, then once more on a fresh one; a
+    # flat loop keeps the retry budget obvious and the cleanup in one place.
+    # Each attempt gets its own collector, so concurrent chats never read
+    # one another's events and a failed attempt's events are simply dropped
+    # with the instance.
+    resp = None
+    last_exc: Optional[Exception] = None
+    used_thread_id = base_thread_id
+    events = ToolEventCollector()
+    for attempt, thread_id in enumerate(
+        (base_thread_id, f"{base_thread_id}-{uuid4().hex[:8]}")
+    ):
+        used_thread_id = thread_id
+        events = ToolEventCollector()
         try:
-            resp = _invoke(used_thread_id)
-            logger.info(f"Agent reply after retry: {resp['messages'][-1].content}")
-        except Exception as e2:
-            # Delete attempt 2 event (if there are)
-            logger.error(f"Agent invocation failed after retries: {e2}", exc_info=True)
-            if len(collector.events) > start_idx:
-                del collector.events[start_idx:]
-            return jsonify({
-                "error": "Agent invocation failed after some retries",
-                "thread_id": used_thread_id,
-                "type": type(e2).__name__,
-                "details": str(e2)
-            }), 500
+            resp = await _invoke(thread_id, events)
+            suffix = " after retry" if attempt else ""
+            logger.info(f"Agent reply{suffix} : {resp['messages'][-1].content}")
+            break
+        except ServiceSaturated as e:
+            return ojson({"error": str(e), "thread_id": used_thread_id}, 429)
+        except Exception as e:
+            last_exc = e
+
+    if resp is None:
+        logger.error(f"Agent invocation failed after retries: {last_exc}", exc_info=last_exc)
+        return ojson({
+            "error": "Agent invocation failed after some retries",
+            "thread_id": used_thread_id,
+            "type": type(last_exc).__name__,
+            "details": str(last_exc)
+        }, 500)
 
     def _latest_artifacts_from_new_events():
-        for ev in reversed(collector.events[start_idx:]):
+        for ev in reversed(events.events):
             out = ev.get("output")
             if out is None:
                 continue
@@ -153,14 +319,16 @@ def chat():
 
     artifacts = _latest_artifacts_from_new_events()
 
-    return jsonify({
+    body_bytes = orjson.dumps({
         "reply": resp["messages"][-1].content,
         "artifacts": artifacts,
         "thread_id": used_thread_id
-    })
+    }, option=orjson.OPT_NON_STR_KEYS)
+    _resp_cache_put(_CHAT_CACHE, cache_key, (time.monotonic(), body_bytes))
+    return Response(body_bytes, mimetype="application/json")
 
 @api.post("/search-flights")
-def search_flights_ep():
+async def search_flights_ep():
     """
     Proxy endpoint to search flights via the tool layer.
 
@@ -171,20 +339,54 @@ def search_flights_ep():
       - other optional fields (e.g., adults, children, class, headless...)
 
     Returns:
-      flask.Response: JSON with the tool's result, or {"error": "..."} with HTTP 400 on failure.
+      quart.Response: JSON with the tool's result, or {"error": "..."} with HTTP 400 on failure.
     """
-    payload = request.get_json(silent=True) or {}
-    for k in ("origin", "destination", "departure_date"):
+    payload = await parse_body()
+    for k in _SEARCH_REQUIRED:
         if not payload.get(k):
-            raise BadRequest(f"Missing required field: {k}")
+            raise BadRequest(_MISSING_MSG(k))
+    # Reject garbage in microseconds rather than spending a semaphore permit
+    # and a browser round-trip on it; parse_dates memoizes, so the tool's own
+    # later parse of the same string is a cache hit.
+    if not isinstance(payload["departure_date"], str):
+        raise BadRequest(
+            f"Invalid value for departure_date: {payload['departure_date']!r}"
+        )
     try:
-        result = run_coro(search_flights_tool_fn(**payload))
-        return jsonify(result)
+        parse_dates(payload["departure_date"])
+    except (ValueError, TypeError) as e:
+        raise BadRequest(str(e))
+    for k in _PAX_FIELDS:
+        v = payload.get(k)
+        if v is not None and (not isinstance(v, int) or v < 0 or (k == "adults" and v < 1)):
+            raise BadRequest(f"Invalid value for {k}: {v!r}")
+    # Serve duplicate searches from cached bytes while the underlying
+    # Playwright session is still alive (the response embeds its session_id).
+    cache_key = _body_key(payload)
+    hit = _resp_cache_get(_FLIGHT_RESP_CACHE, cache_key, _FLIGHT_RESP_CACHE_TTL)
+    if hit is not None and (hit[2] is None or session_exists(hit[2])):
+        return Response(hit[1], mimetype="application/json")
+    try:
+        result = await _admit(FLIGHT_SEM, "flight", search_flights_tool_fn(**payload))
+        body_bytes = orjson.dumps(result, option=orjson.OPT_NON_STR_KEYS)
+        if isinstance(result, dict) and "Error" not in result:
+            _resp_cache_put(
+                _FLIGHT_RESP_CACHE, cache_key,
+                (time.monotonic(), body_bytes, result.get("session_id")),
+            )
+        return Response(body_bytes, mimetype="application/json")
+    except asyncio.TimeoutError:
+        # wait_for cancelled the tool coroutine, so no browser work keeps
+        # running past the response; tell the client it was a timeout, not
+        # a bad request.
+        return ojson({"error": "Flight search timed out."}, 504)
+    except ServiceSaturated as e:
+        return ojson({"error": str(e)}, 429)
     except Exception as e:
-        return jsonify({"error": str(e)}), 400
+        return ojson({"error": str(e)}, 400)
 
 @api.post("/get-flight-urls")
-def get_flight_urls_ep():
+async def get_flight_urls_ep():
     """
     Collect booking URLs/providers for a selected flight.
 
@@ -195,20 +397,31 @@ def get_flight_urls_ep():
       - popup_wait_timeout (int): ms to wait after a provider click (optional)
 
     Returns:
-      flask.Response: JSON list of providers (each with provider/price/logo_url/booking_url),
+      quart.Response: JSON list of providers (each with provider/price/logo_url/booking_url),
                       or {"error": "..."} with HTTP 400 if the tool fails/validation fails.
     """
-    payload = request.get_json(silent=True) or {}
+    payload = await parse_body()
     if not payload.get("session_id"):
-        raise BadRequest("Missing required field: session_id")
+        raise BadRequest(_MISSING_SESSION)
+    flight_no = payload.get("flight_no")
+    if flight_no is not None:
+        if isinstance(flight_no, str):
+            if not flight_no.strip().isdigit():
+                raise BadRequest(f"Invalid value for flight_no: {flight_no!r}")
+        elif not isinstance(flight_no, int) or flight_no < 1:
+            raise BadRequest(f"Invalid value for flight_no: {flight_no!r}")
     try:
-        result = run_coro(get_flight_urls_tool_fn(**payload))
-        return jsonify(result)
+        result = await _admit(FLIGHT_SEM, "flight", get_flight_urls_tool_fn(**payload))
+        return ojson(result)
+    except asyncio.TimeoutError:
+        return ojson({"error": "Collecting booking URLs timed out."}, 504)
+    except ServiceSaturated as e:
+        return ojson({"error": str(e)}, 429)
     except Exception as e:
-        return jsonify({"error": str(e)}), 400
-    
+        return ojson({"error": str(e)}, 400)
+
 @api.post("/select-currency")
-def select_currency_ep():
+async def select_currency_ep():
     """
     Select currency on the flight search page.
 
@@ -217,38 +430,38 @@ def select_currency_ep():
       - currency (str): Currency to select (e.g., "USD") (required)
 
     Returns:
-      flask.Response:   JSON list of converted currency of flight results,
-                        or new setting of currency if there are no rendered flight results on success, 
+      quart.Response:   JSON list of converted currency of flight results,
+                        or new setting of currency if there are no rendered flight results on success,
                         or {"error": "..."} with HTTP 400 on failure.
     """
-    payload = request.get_json(silent=True) or {}
+    payload = await parse_body()
     currency = payload.get("currency_code") or payload.get("currency")
     if not currency:
-        raise BadRequest("Missing required field: currency")
+        raise BadRequest(_MISSING_CURRENCY)
     try:
-        result = run_coro(select_currency_tool_fn(**payload))
-        return jsonify(result)
+        result = await select_currency_tool_fn(**payload)
+        return ojson(result)
     except Exception as e:
-        return jsonify({"error": str(e)}), 400
+        return ojson({"error": str(e)}, 400)
 
 @api.post("/close-session")
-def close_session_ep():
+async def close_session_ep():
     """Close a Playwright session (browser/context/page) and free resources.
 
     Expects JSON body:
       - session_id (str): The session id to close (required).
 
     Returns:
-      flask.Response: {"message": "..."} on success, or {"error": "..."} with HTTP 400 on failure.
+      quart.Response: {"message": "..."} on success, or {"error": "..."} with HTTP 400 on failure.
     """
-    payload = request.get_json(silent=True) or {}
+    payload = await parse_body()
     if not payload.get("session_id"):
-        raise BadRequest("Missing required field: session_id")
+        raise BadRequest(_MISSING_SESSION)
     try:
-        msg = run_coro(close_session_tool_fn(**payload))
-        return jsonify({"message": msg})
+        msg = await close_session_tool_fn(**payload)
+        return ojson({"message": msg})
     except Exception as e:
-        return jsonify({"error": str(e)}), 400
+        return ojson({"error": str(e)}, 400)
 
 app.register_blueprint(api)
 
@@ -1,16 +1,30 @@
 bind = "0.0.0.0:8000"
 
+# ASGI app (Quart): requests multiplex on the worker's event loop, so no
+# thread pool is needed.
 workers = 1
-worker_class = "gthread"
-threads = 8
+worker_class = "uvicorn.workers.UvicornWorker"
 
 timeout = 180
 graceful_timeout = 30
-keepalive = 5
-max_requests = 1000
-max_requests_jitter = 100
+# Browsers keep the UI connection alive between chat turns; a longer
+# keepalive avoids TCP/TLS re-handshakes on every message.
+keepalive = 30
 
-preload_app = False
+# Heartbeat files on tmpfs so container cgroup/disk throttling can't stall
+# worker liveness checks.
+worker_tmp_dir = "/dev/shm"
+
+# No max_requests: recycling a worker mid-flight would kill in-progress LLM
+# batches and live Playwright sessions; the session manager already recycles
+# worn browsers itself.
+
+# Importing app.py no longer starts threads, loops, or signal handlers
+# (those moved to before_serving hooks, which run per worker after fork),
+# so the master can import once and share read-only pages copy-on-write
+# across workers instead of paying the LangChain/Playwright import tax per
+# worker.
+preload_app = True
 
 accesslog = "-"
 errorlog = "-"